@@ -0,0 +1,148 @@
+"""Balance numbers from gameplay telemetry logs (see game.Telemetry).
+
+Every log block is read straight into NumPy columns, and each statistic is a
+handful of whole-array operations, so millions of events take seconds. Rows
+belong to the match opened by the last "start" row before them, so matches
+are numbered by counting start rows.
+
+    python game.py --headless --matches 5000 --telemetry runs.cate   # or play with --telemetry
+    python analytics.py runs.cate [more.cate ...] [--json]
+
+Per game mode it reports:
+    KO time     seconds to a result: mean and percentiles, plus the draw rate
+    hit rate    attacks that hit, light (10 damage) and heavy (25) separately
+    DPS         health taken off opponents per fighter per second of match
+    mouse heal  health given back by mice, and how often a cat that ate won
+                compared with one that didn't
+"""
+import json, sys, time
+import numpy as np
+import game
+
+DTYPES = {"I": "<u4", "B": "u1", "h": "<i2"}
+PERCENTILES = (10, 50, 90, 99)
+
+
+def load(paths):
+    """Concatenate the columns of every block in every log; returns {column: array}."""
+    parts = {name: [] for name, _ in game.TELEMETRY_COLUMNS}
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            magic, version, rows = game.TELEMETRY_HEADER.unpack_from(data, offset)
+            if magic != game.TELEMETRY_MAGIC or version != game.TELEMETRY_VERSION:
+                raise ValueError(f"{path}: not a Cat Fighter telemetry log (or an unsupported version)")
+            offset += game.TELEMETRY_HEADER.size
+            for name, code in game.TELEMETRY_COLUMNS:
+                column = np.frombuffer(data, DTYPES[code], rows, offset)
+                parts[name].append(column)
+                offset += column.nbytes
+    return {name: np.concatenate(chunks) if chunks else np.zeros(0, DTYPES[code])
+            for (name, code), chunks in zip(game.TELEMETRY_COLUMNS, parts.values())}
+
+
+def summarize(ev):
+    """Statistics per mode name, as plain numbers (ready for JSON)."""
+    kind, frame, fighter = ev["kind"], ev["frame"].astype(np.int64), ev["fighter"].astype(np.int64)
+    other, amount = ev["other"].astype(np.int64), ev["amount"].astype(np.int64)
+    match = np.cumsum(kind == game.EV_START) - 1
+    keep = match >= 0  # anything before the first start row can't be placed
+    kind, frame, fighter, other, amount, match = (a[keep] for a in (kind, frame, fighter, other, amount, match))
+    starts = np.flatnonzero(kind == game.EV_START)
+    matches = len(starts)
+    if not matches:
+        return {}
+    mode = ev["amount"][keep][starts]
+    width = int(ev["extra"][keep][starts].max())  # most fighters in one match
+
+    # A match lasts until its result, or its last event if it never finished
+    duration = np.zeros(matches, np.int64)
+    np.maximum.at(duration, match, frame)
+    results = kind == game.EV_RESULT
+    finished = np.zeros(matches, bool)
+    finished[match[results]] = True
+    winner = np.full(matches, -1, np.int64)
+    winner[match[results]] = fighter[results]
+
+    # Per (match, fighter) totals, flattened to match * width + fighter.
+    # Damage rows name the attacker and the health actually lost, so DPS
+    # counts every cat a swing hit and nothing past 0 health; an attack hit
+    # if its attacker shows up on a damage row in the same frame.
+    slot = match * width + fighter
+    attacks = kind == game.EV_ATTACK
+    damage = (kind == game.EV_DAMAGE) & (other >= 0)
+    by = match[damage] * width + other[damage]
+    dealt = np.bincount(by, amount[damage], matches * width)
+    frames = int(frame.max()) + 1
+    hits = attacks & np.isin(slot * frames + frame, by * frames + frame[damage])
+    heals = kind == game.EV_HEAL
+    ate = np.bincount(slot[heals], minlength=matches * width) > 0
+    present = (np.arange(width) < ev["extra"][keep][starts][:, None]).ravel()
+    won = (np.arange(width) == winner[:, None]).ravel()
+    seconds = np.repeat(np.maximum(duration, 1) / game.FPS, width)
+
+    report = {}
+    for code in np.unique(mode):
+        in_mode = mode == code
+        rows = in_mode[match]
+        slots = np.repeat(in_mode, width) & present
+        decided = np.repeat(in_mode & finished & (winner >= 0), width) & present
+        ko = np.sort(duration[in_mode & finished]) / game.FPS
+        stats = {"matches": int(in_mode.sum()), "finished": int(ko.size),
+                 "draw_rate": float((winner[in_mode & finished] < 0).mean()) if ko.size else None,
+                 "ko_seconds": {"mean": float(ko.mean()), **{f"p{p}": float(np.percentile(ko, p))
+                                                             for p in PERCENTILES}} if ko.size else None}
+        for name, damage in (("light", 10), ("heavy", 25)):
+            tried = attacks & rows & (amount == damage)
+            stats[f"{name}_attacks"] = int(tried.sum())
+            stats[f"{name}_hit_rate"] = float((tried & hits).sum() / tried.sum()) if tried.any() else None
+        dps = dealt[slots] / seconds[slots]
+        stats["dps"] = {"mean": float(dps.mean()), "p50": float(np.median(dps)), "p90": float(np.percentile(dps, 90))}
+        stats["jumps_per_minute"] = float((kind[rows] == game.EV_JUMP).sum() / (seconds[slots].sum() / 60))
+        healed = heals & rows
+        stats["mice_eaten"] = int(healed.sum())
+        stats["heal_mean"] = float(amount[healed].mean()) if healed.any() else None
+        stats["win_rate_ate"] = float(won[decided & ate].mean()) if (decided & ate).any() else None
+        stats["win_rate_not_ate"] = float(won[decided & ~ate].mean()) if (decided & ~ate).any() else None
+        report[game.TELEMETRY_MODES[code]] = stats
+    return report
+
+
+def show(mode, s):
+    def pct(v):
+        return "-" if v is None else f"{v * 100:.1f}%"
+    print(f"{mode}: {s['matches']} matches, {s['finished']} finished, draws {pct(s['draw_rate'])}")
+    if s["ko_seconds"]:
+        ko = s["ko_seconds"]
+        print(f"  KO time     mean {ko['mean']:.1f}s  " + "  ".join(f"p{p} {ko[f'p{p}']:.1f}s" for p in PERCENTILES))
+    print(f"  hit rate    light {pct(s['light_hit_rate'])} of {s['light_attacks']}, "
+          f"heavy {pct(s['heavy_hit_rate'])} of {s['heavy_attacks']}")
+    print(f"  DPS         mean {s['dps']['mean']:.2f}  p50 {s['dps']['p50']:.2f}  p90 {s['dps']['p90']:.2f}  "
+          f"({s['jumps_per_minute']:.1f} jumps/min)")
+    heal = "-" if s["heal_mean"] is None else f"{s['heal_mean']:.1f}"
+    print(f"  mouse heal  {s['mice_eaten']} eaten, {heal} health each; "
+          f"win rate {pct(s['win_rate_ate'])} after eating vs {pct(s['win_rate_not_ate'])} without")
+
+
+def main(argv):
+    paths = [a for a in argv if not a.startswith("--")]
+    if not paths:
+        sys.exit(__doc__)
+    began = time.perf_counter()
+    events = load(paths)
+    loaded = time.perf_counter() - began
+    report = summarize(events)
+    elapsed = time.perf_counter() - began
+    if "--json" in argv:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{len(events['kind']):,} events loaded in {loaded:.2f}s, analysed in {elapsed - loaded:.2f}s")
+    for mode, stats in report.items():
+        show(mode, stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
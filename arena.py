@@ -0,0 +1,256 @@
+"""Scrolling arenas many screens wide, loaded from a level file a chunk at a time.
+
+A level file splits the platforms into CHUNK_W-wide vertical strips
+("chunks"). A platform crossing a chunk edge is stored in every chunk it
+touches, so each chunk can be loaded on its own. Opening a level only reads
+the header; a chunk's platforms are read (through mmap) the first time
+physics or the camera needs them, and only the CHUNK_CACHE most recently used
+chunks are kept, so memory use doesn't grow with the level. ArenaView draws
+the stage under the camera from per-chunk surfaces (cached the same way) and
+only ever touches the chunks in view.
+
+File layout (little endian):
+    header     HEADER (magic, version, chunk width, level width, chunks)
+    index      chunks x INDEX (offset of the chunk's platforms, platform count)
+    platforms  PLATFORM (x, y, w, h) records, chunk after chunk
+
+    python arena.py generate levels/long.catl [--screens 40] [--seed 1]
+    python arena.py info levels/long.catl
+    python arena.py tour levels/long.catl     # scroll across it headless, report costs
+    python game.py --level levels/long.catl   # play every mode on it
+"""
+import mmap, os, random, struct, sys, threading, time
+from collections import OrderedDict
+import game
+
+pygame = game.pygame
+
+MAGIC = b"CATL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+INDEX = struct.Struct("<II")
+PLATFORM = struct.Struct("<iiii")
+
+CHUNK_W = 512        # width (pixels) of one chunk
+CHUNK_CACHE = 8      # chunks kept loaded, and stage surfaces kept drawn
+CAMERA_EASE = 0.15   # fraction of the way the camera closes on its target per simulation step
+
+
+def write_level(path, platforms, width, chunk_w=CHUNK_W):
+    """Write platforms (Rects, in order) to a level file width pixels wide."""
+    count = -(-width // chunk_w)
+    chunks = [[] for _ in range(count)]
+    for plat in platforms:
+        for i in range(max(0, plat.left // chunk_w), min(count - 1, (plat.right - 1) // chunk_w) + 1):
+            chunks[i].append(plat)
+    offset = HEADER.size + count * INDEX.size
+    parts, index = [HEADER.pack(MAGIC, VERSION, chunk_w, width, count)], []
+    for chunk in chunks:
+        index.append(INDEX.pack(offset, len(chunk)))
+        offset += len(chunk) * PLATFORM.size
+    parts += index
+    parts += [PLATFORM.pack(*plat) for chunk in chunks for plat in chunk]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"".join(parts))
+
+
+def generate(screens=40, seed=None):
+    """A floor screens windows wide with platforms scattered over it; returns (platforms, width)."""
+    rng = random.Random(seed)
+    width = screens * game.WIN_W
+    floor_h = game.WIN_H - game.GROUND_Y
+    # The floor goes in one piece per chunk so no chunk holds a level-wide rect
+    platforms = [pygame.Rect(x, game.GROUND_Y, min(CHUNK_W, width - x), floor_h)
+                 for x in range(0, width, CHUNK_W)]
+    x = 100
+    while x < width - 200:
+        w = rng.choice((120, 120, 120, 240, 400))
+        platforms.append(pygame.Rect(x, rng.choice((380, 320, 260, 200, 140)), min(w, width - x), 20))
+        x += rng.randrange(120, 320)
+    return platforms, width
+
+
+class ChunkedLevel:
+    """A level file, used like game.Level: physics calls landing(rect, vel_y).
+
+    Chunks come and go through chunk(i), which loads on a miss and evicts the
+    least recently used chunk past capacity. A LookaheadAI worker steps the
+    same level, hence the lock.
+    """
+    def __init__(self, path, capacity=CHUNK_CACHE):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.chunk_w, self.width, self.count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a Cat Fighter level (or an unsupported version)")
+        self.path = path
+        self.capacity = capacity
+        self.chunks = OrderedDict()  # chunk index -> game.Level
+        self.lock = threading.Lock()
+        self.stats = {"loads": 0, "evictions": 0}
+
+    def close(self):
+        self.chunks.clear()
+        self.data.close()
+
+    def chunk(self, i):
+        with self.lock:
+            level = self.chunks.get(i)
+            if level is not None:
+                self.chunks.move_to_end(i)
+                return level
+            offset, count = INDEX.unpack_from(self.data, HEADER.size + i * INDEX.size)
+            level = game.Level([pygame.Rect(PLATFORM.unpack_from(self.data, offset + k * PLATFORM.size))
+                                for k in range(count)], width=self.width)
+            self.chunks[i] = level
+            self.stats["loads"] += 1
+            if len(self.chunks) > self.capacity:
+                self.chunks.popitem(last=False)
+                self.stats["evictions"] += 1
+            return level
+
+    def span(self, left, right):
+        """Indices of the chunks covering x in left..right-1."""
+        return range(max(0, left // self.chunk_w), min(self.count - 1, (right - 1) // self.chunk_w) + 1)
+
+    def landing(self, rect, vel_y):
+        for i in self.span(rect.left, rect.right):
+            plat = self.chunk(i).landing(rect, vel_y)
+            if plat is not None:
+                return plat
+        return None
+
+
+class ArenaView:
+    """The stage under the camera, composited from the chunks in view.
+
+    Each chunk's backdrop slice and platforms are drawn once onto a surface
+    of its own (the backdrop repeats every window width), and the last
+    capacity of those are kept. background() returns a ready stage for a
+    camera position, alternating between two surfaces so DirtyRenderer sees
+    a new background (and flips) exactly when the camera moved.
+    """
+    def __init__(self, level, capacity=CHUNK_CACHE):
+        self.level = level
+        self.capacity = max(capacity, game.WIN_W // level.chunk_w + 2)  # whatever is in view, at least
+        self.surfaces = OrderedDict()
+        self.frames = [pygame.Surface((game.WIN_W, game.WIN_H)).convert() for _ in range(2)]
+        self.current = 0
+        self.x = None
+
+    def chunk_surface(self, i):
+        surf = self.surfaces.get(i)
+        if surf is not None:
+            self.surfaces.move_to_end(i)
+            return surf
+        left = i * self.level.chunk_w
+        surf = pygame.Surface((self.level.chunk_w, game.WIN_H)).convert()
+        for x in range(-(left % game.WIN_W), self.level.chunk_w, game.WIN_W):
+            surf.blit(game.BG_IMG, (x, 0))
+        for plat in self.level.chunk(i):
+            pygame.draw.rect(surf, game.BLACK, plat.move(-left, 0))
+        self.surfaces[i] = surf
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def background(self, camera_x):
+        if camera_x == self.x:
+            return self.frames[self.current]
+        self.current ^= 1
+        frame = self.frames[self.current]
+        frame.blits([(self.chunk_surface(i), (i * self.level.chunk_w - camera_x, 0))
+                     for i in self.level.span(camera_x, camera_x + game.WIN_W)])
+        self.x = camera_x
+        return frame
+
+
+class Camera:
+    """Eases towards the middle of the fighters it follows, kept inside the level.
+
+    A free-for-all follows its human players (all the cats if there are
+    none); a Match follows both fighters. follow() runs once per simulation
+    step, so the easing doesn't depend on the frame rate, and view() blends
+    the last two steps like the fighters are drawn. The camera never lags so
+    far that a followed fighter leaves the screen (game.keep_together makes
+    sure they fit).
+    """
+    def __init__(self, width, ease=CAMERA_EASE):
+        self.width, self.ease = width, ease
+        self.x = self.prev_x = 0.0
+
+    @staticmethod
+    def followed(match):
+        fighters = match.fighters[:getattr(match, "humans", 0)] or match.fighters
+        return [f for f in fighters if not f.dead] or list(fighters)
+
+    def clamp(self, x):
+        return max(0, min(x, self.width - game.WIN_W))
+
+    def target(self, fighters):
+        xs = [f.rect.centerx for f in fighters]
+        return self.clamp((min(xs) + max(xs)) / 2 - game.WIN_W / 2)
+
+    def snap(self, match):
+        self.x = self.prev_x = self.target(self.followed(match))
+
+    def follow(self, match):
+        self.prev_x = self.x
+        fighters = self.followed(match)
+        x = self.x + (self.target(fighters) - self.x) * self.ease
+        lo = max(f.rect.right for f in fighters) - game.WIN_W
+        hi = min(f.rect.left for f in fighters)
+        if lo <= hi:
+            x = max(lo, min(x, hi))
+        self.x = self.clamp(x)
+
+    def view(self, alpha=1.0):
+        """Camera x for drawing, alpha of the way from the previous step."""
+        return round(self.prev_x + (self.x - self.prev_x) * alpha)
+
+
+def tour(path, speed=8):
+    """Open a level and pan across all of it headless; print what it cost."""
+    game.init_headless()
+    began = time.perf_counter()
+    level = ChunkedLevel(path)
+    opened = time.perf_counter() - began
+    game.WIN = pygame.display.set_mode((game.WIN_W, game.WIN_H))
+    game.BG_IMG = pygame.Surface((game.WIN_W, game.WIN_H)).convert()
+    view = ArenaView(level)
+    times, most = [], 0
+    for x in range(0, level.width - game.WIN_W + 1, speed):
+        began = time.perf_counter()
+        game.WIN.blit(view.background(x), (0, 0))
+        times.append(time.perf_counter() - began)
+        most = max(most, len(level.chunks), len(view.surfaces))
+    times.sort()
+    print(f"{path}: {level.width} px, {level.count} chunks, opened in {opened * 1000:.2f} ms")
+    print(f"{len(times)} frames panning {speed} px each: p50 {game.percentile(times, 50) * 1000:.3f} ms, "
+          f"p95 {game.percentile(times, 95) * 1000:.3f} ms; at most {most} chunks loaded; {level.stats}")
+
+
+def main(argv):
+    def option(name, default, kind=int):
+        return kind(argv[argv.index(name) + 1]) if name in argv else default
+
+    if len(argv) < 2 or argv[0] not in ("generate", "info", "tour"):
+        sys.exit(__doc__)
+    what, path = argv[:2]
+    if what == "generate":
+        platforms, width = generate(option("--screens", 40), option("--seed", None))
+        write_level(path, platforms, width)
+        print(f"wrote {path}: {width} px, {len(platforms)} platforms, {os.path.getsize(path)} bytes")
+    elif what == "info":
+        level = ChunkedLevel(path)
+        counts = [INDEX.unpack_from(level.data, HEADER.size + i * INDEX.size)[1] for i in range(level.count)]
+        print(f"{path}: {level.width} px ({level.width / game.WIN_W:.1f} screens), {level.count} chunks "
+              f"of {level.chunk_w} px, {sum(counts)} platform records (most in one chunk: {max(counts)})")
+    else:
+        tour(path, option("--speed", 8))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
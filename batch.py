@@ -0,0 +1,253 @@
+"""Vectorized engine that steps thousands of two-fighter matches at once.
+
+Every fighter field that Fighter keeps on the object (rect position, vel_y,
+health, timers, cooldown, facing, frame) lives here in a NumPy array of shape
+(matches, 2). One step() applies gravity, platform landing, attack hitboxes and
+the resolve_match KO rules to all matches with whole-array operations, in the
+same order game.Match does for a "2player" match: p1 updates (timers, input,
+attack, physics), then p2, then both are clamped to the screen and the KO is
+resolved. Mice are not simulated.
+
+Inputs are one bitmask per fighter per frame (LEFT | RIGHT | JUMP | LIGHT |
+HEAVY).
+
+    python batch.py --parity          # compare against game.Match frame by frame
+    python batch.py --bench 4096 600  # matches, frames
+"""
+import sys, time
+import numpy as np
+import game
+
+# Same bit order as game.CONTROL_NAMES
+LEFT, RIGHT, JUMP, LIGHT, HEAVY = 1, 2, 4, 8, 16
+
+# (damage, reach, cooldown) as passed to Fighter.attack
+LIGHT_ATTACK = (10, 50, 15)
+HEAVY_ATTACK = (25, 40, 35)
+
+FIGHTER_W, FIGHTER_H = 30, 80
+
+# result codes, see RESULT_NAMES
+RESULT_NONE, RESULT_P1, RESULT_P2, RESULT_DRAW = 0, 1, 2, 3
+RESULT_NAMES = {RESULT_NONE: None, RESULT_P1: "player1", RESULT_P2: "player2", RESULT_DRAW: "draw"}
+
+
+def rect_round(v):
+    """Round like assigning a float to a pygame.Rect field (half away from zero)."""
+    whole = np.trunc(v)
+    half = np.abs(v - whole) == 0.5
+    return np.where(half, whole + np.sign(v), np.rint(v)).astype(np.int64)
+
+
+def bits_to_keys(bits, fighters):
+    """KeyState for a (p1, p2) pair of per-fighter masks (see game.bits_to_keys)."""
+    return game.bits_to_keys(int(bits[0]) | int(bits[1]) << 5, fighters)
+
+
+class BatchEngine:
+    def __init__(self, matches, platforms=None):
+        self.n = matches
+        platforms = game.PLATFORMS if platforms is None else platforms
+        self.plat_left = np.array([p.left for p in platforms], dtype=np.int64)
+        self.plat_right = np.array([p.right for p in platforms], dtype=np.int64)
+        self.plat_top = np.array([p.top for p in platforms], dtype=np.int64)
+
+        # Start from the same spawn state as game.reset()
+        start = game.reset()
+        def column(values, dtype):
+            return np.tile(np.array(values, dtype=dtype), (matches, 1))
+        self.x = column([f.rect.x for f in start], np.int64)
+        self.y = column([f.rect.y for f in start], np.int64)
+        self.vel_y = column([f.vel_y for f in start], np.float64)
+        self.health = column([f.health for f in start], np.int64)
+        self.facing = column([f.facing for f in start], np.int64)
+        self.on_ground = column([f.on_ground for f in start], bool)
+        self.attack_cd = column([f.attack_cd for f in start], np.int64)
+        self.frame = column([f.frame for f in start], np.int64)
+        self.anim_timer = column([f.anim_timer for f in start], np.int64)
+        self.hurt_timer = column([f.hurt_timer for f in start], np.int64)
+        self.dead = column([f.dead for f in start], bool)
+        self.winner = column([f.winner for f in start], bool)
+        self.result = np.zeros(matches, dtype=np.int8)
+        self.frames = np.zeros(matches, dtype=np.int64)
+
+    # one fighter, every match -------------------------------------------------
+    def _update_fighter(self, i, keys, active):
+        j = 1 - i
+        x, y, vel_y = self.x[:, i], self.y[:, i], self.vel_y[:, i]
+        cd, anim, hurt = self.attack_cd[:, i], self.anim_timer[:, i], self.hurt_timer[:, i]
+        frame, facing = self.frame[:, i], self.facing[:, i]
+        m = active & ~self.dead[:, i]
+
+        # timers (Fighter.update)
+        cd -= m & (cd > 0)
+        hurt -= m & (hurt > 0)
+        animating = m & (anim > 0)
+        anim -= animating
+        frame[m & ~animating & (hurt == 0) & ~self.winner[:, i]] = 0
+
+        # movement and jump (Fighter.handle_input)
+        m &= ~self.winner[:, i]
+        left = m & (keys & LEFT != 0)
+        right = m & (keys & RIGHT != 0)
+        facing[left] = -1
+        facing[right] = 1
+        x += np.where(right, 5, np.where(left, -5, 0))
+        jump = m & (keys & JUMP != 0) & self.on_ground[:, i]
+        vel_y[jump] = -15
+        frame[jump] = 2
+        anim[jump] = 15
+
+        # attacks (Fighter.attack / take_damage)
+        can = m & (cd <= 0)
+        light = can & (keys & LIGHT != 0)
+        heavy = can & ~light & (keys & HEAVY != 0)
+        attacking = light | heavy
+        dmg = np.where(light, LIGHT_ATTACK[0], HEAVY_ATTACK[0])
+        reach = np.where(light, LIGHT_ATTACK[1], HEAVY_ATTACK[1])
+        frame[attacking] = 1
+        anim[attacking] = 7
+        cd[attacking] = np.where(light, LIGHT_ATTACK[2], HEAVY_ATTACK[2])[attacking]
+
+        hit_x = x + FIGHTER_W // 2 + (facing * reach) // 2 - reach // 2
+        hit_y = y + 20
+        ox, oy = self.x[:, j], self.y[:, j]
+        hit = (attacking & ~self.dead[:, j] & ~self.winner[:, j]
+               & (hit_x < ox + FIGHTER_W) & (hit_y < oy + FIGHTER_H)
+               & (hit_x + reach > ox) & (hit_y + 40 > oy))
+        opp_health = self.health[:, j]
+        opp_health[hit] = np.maximum(0, opp_health - dmg)[hit]
+        self.hurt_timer[hit, j] = 18
+        self.frame[hit, j] = 3
+        ox += np.where(hit, facing * 10, 0)
+
+        # gravity and platform landing (Fighter.physics)
+        m = active & ~self.dead[:, i]
+        new_vel = vel_y + game.GRAVITY
+        vel_y[m] = new_vel[m]
+        y[m] = rect_round(y + vel_y)[m]
+        self.on_ground[m, i] = False
+
+        bottom = (y + FIGHTER_H)[:, None]
+        landed = (m & (vel_y >= 0))[:, None] & (
+            (bottom >= self.plat_top)
+            & (bottom - vel_y[:, None] <= self.plat_top + 5)
+            & ((x + FIGHTER_W)[:, None] > self.plat_left)
+            & (x[:, None] < self.plat_right))
+        on_plat = landed.any(axis=1)
+        first = landed.argmax(axis=1)  # first platform in list order, like the break
+        y[on_plat] = self.plat_top[first[on_plat]] - FIGHTER_H
+        vel_y[on_plat] = 0
+        self.on_ground[on_plat, i] = True
+
+    def step(self, inputs):
+        """Advance every unfinished match by one frame.
+
+        inputs is an int array of shape (matches, 2) of LEFT/RIGHT/JUMP/LIGHT/HEAVY
+        bits. Returns the result array (RESULT_* codes).
+        """
+        inputs = np.asarray(inputs)
+        active = self.result == RESULT_NONE
+        self._update_fighter(0, inputs[:, 0], active)
+        self._update_fighter(1, inputs[:, 1], active)
+        np.clip(self.x, 0, game.WIN_W - FIGHTER_W, out=self.x)
+        self.frames += active
+
+        # resolve_match for every match that just had a knockout
+        ko = active[:, None] & (self.health <= 0)
+        self.health[ko] = 0
+        self.dead |= ko
+        self.frame[ko] = 4
+        self.winner[ko] = False
+
+        p1_ko, p2_ko = ko[:, 0], ko[:, 1]
+        draw = p1_ko & p2_ko
+        self.result[draw] = RESULT_DRAW
+        for loser, winner, code in ((p2_ko, 0, RESULT_P1), (p1_ko, 1, RESULT_P2)):
+            won = loser & ~draw
+            self.result[won] = code
+            self.winner[won, winner] = True
+            self.frame[won, winner] = 5
+            anim = self.anim_timer[:, winner]
+            anim[won] = np.maximum(anim[won], 30)
+        return self.result
+
+    def fighter_state(self, match, i):
+        """One fighter's fields as plain Python values, named like Fighter's."""
+        return {
+            "x": int(self.x[match, i]), "y": int(self.y[match, i]),
+            "vel_y": float(self.vel_y[match, i]), "health": int(self.health[match, i]),
+            "facing": int(self.facing[match, i]), "on_ground": bool(self.on_ground[match, i]),
+            "attack_cd": int(self.attack_cd[match, i]), "frame": int(self.frame[match, i]),
+            "anim_timer": int(self.anim_timer[match, i]), "hurt_timer": int(self.hurt_timer[match, i]),
+            "dead": bool(self.dead[match, i]), "winner": bool(self.winner[match, i]),
+        }
+
+
+def fighter_state(fighter):
+    return {
+        "x": fighter.rect.x, "y": fighter.rect.y, "vel_y": float(fighter.vel_y),
+        "health": fighter.health, "facing": fighter.facing, "on_ground": fighter.on_ground,
+        "attack_cd": fighter.attack_cd, "frame": fighter.frame,
+        "anim_timer": fighter.anim_timer, "hurt_timer": fighter.hurt_timer,
+        "dead": fighter.dead, "winner": fighter.winner,
+    }
+
+
+def random_inputs(rng, matches, frames, change=0.1):
+    """Held-key input streams: each fighter switches to a new random mask now and then."""
+    out = np.zeros((frames, matches, 2), dtype=np.uint8)
+    current = rng.integers(0, 32, size=(matches, 2))
+    for f in range(frames):
+        switch = rng.random((matches, 2)) < change
+        current = np.where(switch, rng.integers(0, 32, size=(matches, 2)), current)
+        out[f] = current
+    return out
+
+
+def check_parity(matches=64, frames=1500, seed=0):
+    """Run the same inputs through BatchEngine and game.Match("2player").
+
+    Returns None when every field matches on every frame, otherwise a message
+    describing the first difference.
+    """
+    inputs = random_inputs(np.random.default_rng(seed), matches, frames)
+    engine = BatchEngine(matches)
+    spawn_chance, game.MOUSE_SPAWN_CHANCE = game.MOUSE_SPAWN_CHANCE, 0
+    try:
+        scalar = [game.Match("2player") for _ in range(matches)]
+        for f in range(frames):
+            engine.step(inputs[f])
+            for m, match in enumerate(scalar):
+                fighters = (match.p1, match.p2)
+                match.step(bits_to_keys(inputs[f, m], fighters))
+                for i, fighter in enumerate(fighters):
+                    expected, got = fighter_state(fighter), engine.fighter_state(m, i)
+                    if expected != got:
+                        return f"frame {f + 1}, match {m}, fighter {i + 1}: expected {expected}, got {got}"
+                if RESULT_NAMES[int(engine.result[m])] != match.result:
+                    return f"frame {f + 1}, match {m}: expected result {match.result}, got {engine.result[m]}"
+    finally:
+        game.MOUSE_SPAWN_CHANCE = spawn_chance
+    return None
+
+
+def bench(matches=4096, frames=600, seed=0):
+    inputs = random_inputs(np.random.default_rng(seed), matches, frames)
+    engine = BatchEngine(matches)
+    start = time.perf_counter()
+    for f in range(frames):
+        engine.step(inputs[f])
+    elapsed = time.perf_counter() - start
+    return matches * frames / elapsed
+
+
+if __name__ == "__main__":
+    if "--parity" in sys.argv:
+        problem = check_parity()
+        print(problem or "parity ok")
+        sys.exit(1 if problem else 0)
+    args = sys.argv[sys.argv.index("--bench") + 1:] if "--bench" in sys.argv else []
+    matches = int(args[0]) if args else 4096
+    frames = int(args[1]) if len(args) > 1 else 600
+    print(f"{bench(matches, frames):,.0f} match-frames/s ({matches} matches x {frames} frames)")
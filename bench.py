@@ -0,0 +1,287 @@
+"""Benchmarks for the game's hot paths.
+
+    python bench.py platforms    # physics cost per frame vs. platform count
+    python bench.py hotpaths     # every hot path, headless, against a stored baseline
+
+hotpaths options:
+    --json PATH         also write the results as JSON
+    --baseline PATH     baseline to compare with (default bench_baseline.json)
+    --save-baseline     write this run as the new baseline instead of comparing
+    --threshold PCT     slowdown that counts as a regression (default 15)
+
+Compared against a baseline, hotpaths exits with status 1 if any path got more
+than the threshold slower, and with status 2 if there is no baseline to
+compare with (unless --save-baseline is given). Baselines are per machine:
+save one on the machine you compare on, before making the change.
+"""
+import json, platform, random, sys, time
+import pygame
+import game
+
+
+def random_level(count, seed=0):
+    """count platforms spread over a world wide enough to keep the density of the default stage."""
+    rng = random.Random(seed)
+    width = max(game.WIN_W, count * 150)
+    platforms = [pygame.Rect(0, game.GROUND_Y, width, 20)]
+    for _ in range(count - 1):
+        platforms.append(pygame.Rect(rng.randrange(0, width - 120), rng.randrange(100, game.GROUND_Y - 40), 120, 20))
+    return game.Level(platforms)
+
+
+def time_physics(level, frames=20000, fighters=8, seed=0, linear=False):
+    """Seconds per fighter physics() call, jumping around a level.
+
+    linear=True forces the old scan over every platform for comparison.
+    """
+    rng = random.Random(seed)
+    level.linear = linear
+    width = level.platforms[0].width
+    crew = []
+    for _ in range(fighters):
+        f = game.Fighter(rng.randrange(0, width - 30), 0, 0, {}, 1)
+        f.level = level
+        crew.append(f)
+
+    start = time.perf_counter()
+    for frame in range(frames // fighters):
+        for f in crew:
+            if f.on_ground and rng.random() < 0.05:
+                f.vel_y = -15
+            f.physics()
+    return (time.perf_counter() - start) / (frames // fighters * fighters)
+
+
+def bench_platforms(counts=(6, 100, 1000, 10000, 100000), linear_max=10000, out=print):
+    out(f"{'platforms':>10}  {'grid us/call':>12}  {'linear us/call':>14}")
+    rows = []
+    for count in counts:
+        level = random_level(count)
+        grid = time_physics(level)
+        linear = time_physics(level, frames=2000, linear=True) if count <= linear_max else None
+        rows.append((count, grid, linear))
+        out(f"{count:>10}  {grid * 1e6:>12.2f}  {'-' if linear is None else f'{linear * 1e6:.2f}':>14}")
+    return rows
+
+
+HOTPATH_BASELINE = "bench_baseline.json"
+HOTPATH_THRESHOLD = 15  # percent slower than the baseline that fails the run
+
+
+def open_headless_window():
+    """Window and sprites on the SDL dummy drivers, so the draw paths do their real blits."""
+    game.init_headless()
+    game.open_window()
+    images = {name: pygame.image.load(game.resource_path(filename))
+              for name, filename in game.AssetManager.IMAGES.items()}
+    game.install_images(images["bg"], [images["cat1"], images["cat2"]])
+
+
+def per_call(fn, calls, repeats=5):
+    """Best of repeats runs of calls fn() calls, in seconds per call."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def scripted_keys(fighters, frames=600, hold=10, seed=0):
+    """Random key masks for both players, each held for hold frames."""
+    rng = random.Random(seed)
+    keys = []
+    for _ in range(frames // hold):
+        keys += [game.bits_to_keys(rng.getrandbits(10), fighters)] * hold
+    return keys
+
+
+def case_physics():
+    rng = random.Random(0)
+    f = game.Fighter(150, game.GROUND_Y - 80, 0, {}, 1)
+    def run():
+        if f.on_ground and rng.random() < 0.05:
+            f.vel_y = -15
+        f.physics()
+    return run
+
+
+def case_ai_control():
+    p1, p2 = game.reset()
+    p1.rng = p2.rng = random.Random(0)
+    def run():
+        p2.ai_control(p1)
+        p2.physics()
+        p2.rect.x = max(0, min(p2.rect.x, game.WIN_W - p2.rect.width))
+        if p1.health < 50:
+            p1.health = 200
+    return run
+
+
+def case_attack():
+    p1, p2 = game.reset()
+    def run():
+        p2.rect.x = p1.rect.right + 5  # in reach, undoing the knockback
+        p2.health = 200
+        p1.attack(p2, 10, 50, 8, 15)
+    return run
+
+
+def case_fighter_draw():
+    f = game.Fighter(150, game.GROUND_Y - 80, 0, {}, 1)
+    def run():
+        f.frame = (f.frame + 1) % 9
+        f.facing = -f.facing
+        f.draw(game.WIN, 0.5)
+    return run
+
+
+def full_pool(seed=0):
+    rng = random.Random(seed)
+    mice = game.MousePool(game.SWARM_MICE)
+    for _ in range(game.SWARM_MICE):
+        mouse = mice.spawn(rng.random() < 0.5)
+        mouse.rect.x = mouse.prev_x = rng.randrange(0, game.WIN_W)
+    return mice, rng
+
+
+def case_mice_update():
+    mice, rng = full_pool()
+    def run():
+        mice.update()
+        while len(mice) < mice.capacity:  # keep the pool full
+            mice.spawn(rng.random() < 0.5)
+    return run
+
+
+def case_mice_draw():
+    mice, _ = full_pool()
+    return lambda: mice.draw(game.WIN, 0.5)
+
+
+def case_health_bar():
+    health = iter(range(10**9))
+    return lambda: game.health_bar(game.WIN, 20, 20, next(health) % 201)
+
+
+def case_frame():
+    """One main-loop frame without the frame cap: a 2-player step and a dirty-rect redraw."""
+    match = game.Match("2player", seed=0)
+    keys = scripted_keys((match.p1, match.p2))
+    renderer = game.DirtyRenderer(game.WIN)
+    stage, hud = game.draw_stage(), game.Hud()
+    def run():
+        nonlocal match
+        if match.result is not None:
+            match = game.Match("2player", seed=0)
+        match.step(keys[match.frame % len(keys)])
+        damaged = renderer.begin(stage)
+        renderer.present(*game.draw_match(game.WIN, match, hud, damaged, 0.5))
+    return run
+
+
+def case_snapshot():
+    match = game.Match("2player", seed=0)
+    return match.snapshot
+
+
+def case_restore():
+    match = game.Match("2player", seed=0)
+    state = match.snapshot()
+    return lambda: match.restore(state)
+
+
+def case_free_for_all():
+    """One step of a 64-cat all-AI free-for-all, restarted whenever it ends."""
+    match = game.FreeForAll(64, humans=0, seed=0)
+    def run():
+        nonlocal match
+        if match.result is not None:
+            match = game.FreeForAll(64, humans=0, seed=0)
+        match.step()
+    return run
+
+
+# name: (case, calls per repeat)
+HOTPATHS = {
+    "physics": (case_physics, 20000),
+    "ai_control": (case_ai_control, 20000),
+    "attack": (case_attack, 20000),
+    "fighter_draw": (case_fighter_draw, 5000),
+    "mice_update": (case_mice_update, 500),
+    "mice_draw": (case_mice_draw, 200),
+    "health_bar": (case_health_bar, 5000),
+    "frame": (case_frame, 600),
+    "snapshot": (case_snapshot, 5000),
+    "restore": (case_restore, 5000),
+    "ffa_step": (case_free_for_all, 1000),
+}
+
+
+def bench_hotpaths(out=print):
+    """Microseconds per call of every hot path, keyed by name."""
+    open_headless_window()
+    results = {}
+    for name, (case, calls) in HOTPATHS.items():
+        results[name] = per_call(case(), calls) * 1e6
+        out(f"{name:>14}  {results[name]:10.2f} us")
+    return results
+
+
+def compare(results, baseline, threshold=HOTPATH_THRESHOLD, out=print):
+    """Print each path against the baseline; returns the names that regressed."""
+    regressed = []
+    out(f"{'path':>14}  {'us/call':>10}  {'baseline':>10}  {'change':>8}")
+    for name, us in results.items():
+        base = baseline.get(name)
+        if not base:
+            out(f"{name:>14}  {us:10.2f}  {'-':>10}  {'new':>8}")
+            continue
+        change = (us - base) / base * 100
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        out(f"{name:>14}  {us:10.2f}  {base:10.2f}  {change:+7.1f}%{flag}")
+    return regressed
+
+
+def hotpaths_main(argv):
+    def option(name, default=None):
+        return argv[argv.index(name) + 1] if name in argv else default
+
+    results = bench_hotpaths()
+    report = {"unit": "us/call", "python": platform.python_version(),
+              "pygame": pygame.version.ver, "machine": platform.machine(), "results": results}
+    if option("--json"):
+        with open(option("--json"), "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = option("--baseline", HOTPATH_BASELINE)
+    if "--save-baseline" in argv:
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {baseline_path}")
+        return 0
+    try:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        print(f"no baseline at {baseline_path}; run with --save-baseline first")
+        return 2
+    regressed = compare(results, baseline, float(option("--threshold", HOTPATH_THRESHOLD)))
+    if regressed:
+        print(f"regressed by more than the threshold: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    what = sys.argv[1] if len(sys.argv) > 1 else "platforms"
+    if what == "platforms":
+        bench_platforms()
+    elif what == "hotpaths":
+        sys.exit(hotpaths_main(sys.argv[2:]))
+    else:
+        sys.exit(f"unknown benchmark: {what}")
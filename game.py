@@ -1,6 +1,8 @@
-import pygame, sys, random,os
-pygame.init()
-random.seed()  # Initialize random seed
+import pygame, sys, random,os, time, io, hashlib, mmap, threading, json, csv, struct, operator, queue, atexit
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+START_TIME = time.perf_counter()  # for the time-to-first-frame / interactive report
 
 def resource_path(relative_path):
     try:
@@ -8,13 +10,6 @@ def resource_path(relative_path):
     except Exception:
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
-# Background Music
-try:
-    pygame.mixer.music.load(resource_path("bgm.mp3"))
-    pygame.mixer.music.set_volume(0.5)  # 0.0 to 1.0 (optional)
-    pygame.mixer.music.play(-1)         # -1 means loop forever
-except Exception as e:
-    print("Couldn't load background music:", e)
 
 # -------------------------------------------------
 # CONFIG
@@ -41,61 +36,432 @@ WHITE, BLACK = (255, 255, 255), (0, 0, 0)
 GREEN, RED   = (0, 255, 0), (220, 30, 60)
 
 # Add after the CONFIG section
-GAME_STATE = "menu"  # "menu", "1player", "2player"
+GAME_STATE = "menu"  # "menu", "1player", "2player", "swarm", "hard", "ffa"
 AI_DIFFICULTY = 0.7  # Chance of AI making a decision each frame
 
 # Add after other constants
 MOUSE_SPEED = 3
 MOUSE_SPAWN_CHANCE = 0.001  # Chance per frame of spawning a mouse
+SWARM_MICE = 400            # Most mice out at once in the "swarm" mode
+SWARM_SPAWN_CHANCE = 0.5    # Chance per frame of a new mouse in the "swarm" mode
 EAT_ANIMATION_FRAMES = 60   # Increased from 30 to 60 for longer eating animation
 FRAMES = 10  # Update from 6 to 10 to include mouse, eat1, eat2 frames
+SHOW_CACHE_STATS = False    # Show how many sprite surface allocations the frame cache saved
+DIRTY_FULL_FRACTION = 0.4   # Flip the whole screen when more than this much of it changed
+TEXT_CACHE_SIZE = 64        # Rendered text surfaces kept around
+LEVEL_CELL = 64             # Grid cell size (pixels) of the platform index
+LEVEL_LINEAR_MAX = 16       # Levels this small skip the index and scan every platform
+SIM_DT = 1 / FPS            # The simulation always advances in steps of this many seconds
+MAX_CATCHUP_STEPS = 5       # Most simulation steps run for one rendered frame
+RENDER_FPS = 144            # Render cap when the display's refresh rate can't be read
+ASSET_WORKERS = 4           # Threads decoding images and sounds at startup
+AUDIO_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cat-fighter", "pcm")
+SOUND_CHANNELS = 8          # Mixer channels shared by all sound effects
+SOUND_PRIORITY = {"hit": 3, "heavy": 2, "light": 2, "eat": 2, "jump": 1}  # Higher cuts off lower
+PROFILE_WINDOW = 300        # Frames the profiler overlay's percentiles and graph cover
+LOOKAHEAD_BUDGET = 0.004    # Seconds the "hard" AI may think per simulation step
+LOOKAHEAD_FRAMES = 30       # How far ahead each of its candidate plans is simulated
+LOOKAHEAD_SWITCH = 10       # Frame in a plan where it can change to a second action
+INPUT_LATENCY_WINDOW = 600  # Presses the input latency report covers
+INPUT_REPORT_EVERY = 5.0    # Seconds between input latency reports when measuring
+FFA_FIGHTERS = 32           # Cats in a free-for-all (player 1 plus AI)
+FFA_MICE = 4                # Most mice out at once in a free-for-all
+FFA_SPAWN_CHANCE = 0.01     # Chance per frame of a new mouse in a free-for-all
+ARENA_CELL = 64             # Cell size (pixels) of the free-for-all hit detection grid
+TELEMETRY_BLOCK = 8192      # Gameplay events buffered before a block goes to the log writer
+
 # -------------------------------------------------
-# WINDOW & ASSETS
+# LEVEL GEOMETRY
 # -------------------------------------------------
-WIN = pygame.display.set_mode((WIN_W, WIN_H))
-pygame.display.set_caption("Cat Fighter")
+class Level:
+    """Platforms plus a uniform grid over them, so landing checks stay cheap.
 
-# For file directly from upload location:
-BG_IMG = pygame.image.load(resource_path("bakground.jpg")).convert()
-BG_IMG = pygame.transform.scale(BG_IMG, (WIN_W, WIN_H))
+    Each platform is filed under the cells its top edge spans. landing() only
+    looks at the cells a fighter's feet sweep through in one frame, and still
+    returns the first platform in list order, like the old linear scan. Tiny
+    levels (like the default six platforms) are still scanned directly, which
+    is cheaper than the cell lookups. width is how far right fighters may go.
+    """
+    def __init__(self, platforms, cell=LEVEL_CELL, width=None):
+        self.platforms = list(platforms)
+        self.cell = cell
+        self.width = width or max((p.right for p in self.platforms), default=WIN_W)
+        self.linear = len(self.platforms) <= LEVEL_LINEAR_MAX
+        self.grid = {}
+        for i, plat in enumerate(self.platforms):
+            row = plat.top // cell
+            for col in range(plat.left // cell, (plat.right - 1) // cell + 1):
+                self.grid.setdefault((col, row), []).append(i)
 
+    def __iter__(self):
+        return iter(self.platforms)
 
-SPRITES = [
-    pygame.image.load(resource_path("cat1.png")).convert_alpha(),
-    pygame.image.load(resource_path("cat2.png")).convert_alpha()
-]
-# Add this debug code
-print(f"Sprite 1 size: {SPRITES[0].get_size()}")
-print(f"Sprite 2 size: {SPRITES[1].get_size()}")
+    def __len__(self):
+        return len(self.platforms)
+
+    def landing(self, rect, vel_y):
+        """Platform rect lands on after moving down by vel_y this frame, or None."""
+        bottom = rect.bottom
+        if self.linear:
+            for plat in self.platforms:
+                if (bottom >= plat.top and
+                    bottom - vel_y <= plat.top + 5 and  # More forgiving collision
+                    rect.right > plat.left and
+                    rect.left < plat.right):
+                    return plat
+            return None
+
+        # A platform catches the feet when top <= bottom <= top + 5 + vel_y
+        first_row = int((bottom - vel_y - 5) // self.cell)
+        last_row = bottom // self.cell
+        first_col, last_col = rect.left // self.cell, (rect.right - 1) // self.cell
+        best = None
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                for i in self.grid.get((col, row), ()):
+                    if best is not None and i >= best:
+                        continue
+                    plat = self.platforms[i]
+                    if (bottom >= plat.top and
+                        bottom - vel_y <= plat.top + 5 and  # More forgiving collision
+                        rect.right > plat.left and
+                        rect.left < plat.right):
+                        best = i
+        return None if best is None else self.platforms[best]
+
+LEVEL = Level(PLATFORMS)
+# -------------------------------------------------
+# WINDOW & ASSETS
+# -------------------------------------------------
+# Nothing here is loaded at import time: open_window() and an AssetManager
+# (or load_assets(), which does both and waits) fill these in for the windowed
+# game. The headless simulation never touches them, so `sounds` stays empty
+# and no sound is played. Sounds can also still be missing for a moment after
+# the menu comes up, while they finish decoding.
+WIN = None
+BG_IMG = None
+SPRITES = []
+FRAME_CACHE = {}
+FRAME_COUNTS = []
+clock = None
+font = None
+text_cache = None
 
 def load_sound(filename):
     """Load one optional sound without disabling the other effects."""
     try:
-        return pygame.mixer.Sound(resource_path(filename))
+        return load_pcm(filename)
     except (OSError, pygame.error) as error:
         print(f"Couldn't load sound effect '{filename}': {error}")
         return None
 
+# -------------------------------------------------
+# AUDIO
+# -------------------------------------------------
+# Decoding the MP3s dominates startup, so every effect is decoded once and its
+# raw samples kept in AUDIO_CACHE_DIR. A cache file is named after a hash of
+# the source file and the mixer format, so an edited sound or a different
+# output format never picks up stale samples. The music keeps streaming
+# through pygame.mixer.music, which decodes as it plays.
+def load_pcm(filename, cache_dir=AUDIO_CACHE_DIR):
+    """Sound for filename, memory-mapped from the PCM cache (decoded and cached on a miss)."""
+    path = resource_path(filename)
+    with open(path, "rb") as f:
+        key = hashlib.sha1(f.read())
+    key.update(repr(pygame.mixer.get_init()).encode())
+    cached = os.path.join(cache_dir, key.hexdigest() + ".pcm")
+    try:
+        with open(cached, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pcm:
+            return pygame.mixer.Sound(buffer=pcm)
+    except (OSError, ValueError):
+        pass  # not cached yet (an empty file can't be mapped either)
+
+    sound = pygame.mixer.Sound(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Loader threads may race on the same file; whoever renames last wins
+        tmp = f"{cached}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(sound.get_raw())
+        os.replace(tmp, cached)
+    except OSError as error:
+        print(f"Couldn't cache sound effect '{filename}': {error}")
+    return sound
+
+class SoundManager:
+    """Plays the effects on a fixed pool of channels, most important first.
+
+    play() takes a free channel if there is one, otherwise cuts off the
+    lowest-priority effect still playing (SOUND_PRIORITY) if it ranks below the
+    new one, otherwise drops the new one. An effect starts at most once per
+    rendered frame; end_frame() clears that. The mouse squeak loops on a
+    channel of its own so it never holds one of the effect channels. Until
+    setup() has run every call does nothing, which keeps headless runs silent;
+    calls from any thread but the one that ran setup() (planners stepping a
+    private Match) do nothing either.
+    """
+    def __init__(self, channels=SOUND_CHANNELS, priority=SOUND_PRIORITY):
+        self.size = channels
+        self.priority = priority
+        self.sounds = {}
+        self.channels = []
+        self.playing = []  # priority of the effect each channel last started
+        self.loop_channel = None
+        self.this_frame = set()
+        self.muted = False  # set while re-simulating frames that already made their sounds
+        self.owner = None
+        self.stats = {"played": 0, "deduped": 0, "stolen": 0, "dropped": 0}
+
+    def setup(self):
+        if not pygame.mixer.get_init():
+            return
+        # Channel 0 loops, the rest are the effect pool; reserving all of them
+        # keeps Sound.play() from ever picking one behind our back
+        pygame.mixer.set_num_channels(self.size + 1)
+        pygame.mixer.set_reserved(self.size + 1)
+        self.loop_channel = pygame.mixer.Channel(0)
+        self.channels = [pygame.mixer.Channel(i) for i in range(1, self.size + 1)]
+        self.playing = [0] * self.size
+        self.owner = threading.get_ident()
+
+    def add(self, name, sound):
+        if sound is not None:
+            self.sounds[name] = sound
+
+    def play(self, name):
+        sound = self.sounds.get(name)
+        if sound is None or self.muted or threading.get_ident() != self.owner:
+            return None
+        if name in self.this_frame:
+            self.stats["deduped"] += 1
+            return None
+
+        priority = self.priority.get(name, 0)
+        index, lowest = None, priority
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                index = i
+                break
+            if self.playing[i] < lowest:
+                index, lowest = i, self.playing[i]
+        if index is None:
+            self.stats["dropped"] += 1
+            return None
+
+        channel = self.channels[index]
+        if channel.get_busy():
+            self.stats["stolen"] += 1
+        channel.play(sound)
+        self.playing[index] = priority
+        self.this_frame.add(name)
+        self.stats["played"] += 1
+        return channel
+
+    def loop(self, name):
+        sound = self.sounds.get(name)
+        if sound is not None and threading.get_ident() == self.owner:
+            self.loop_channel.play(sound, -1)
+
+    def stop_loop(self):
+        if self.loop_channel is not None and threading.get_ident() == self.owner:
+            self.loop_channel.stop()
+
+    def end_frame(self):
+        self.this_frame.clear()
+
+sounds = SoundManager()
+
+# -------------------------------------------------
+# FRAME CACHE
+# -------------------------------------------------
+# Every frame of every sheet is cut out, scaled and flipped once here, so
+# drawing a sprite is just a dict lookup and a blit.
+def build_frame_cache(sprites):
+    cache = {}
+    for sheet_idx, sheet in enumerate(sprites):
+        for frame_id in range(sheet.get_width() // FRAME_W):
+            src = pygame.Rect(frame_id * FRAME_W, 0, FRAME_W, FRAME_H)
+            img = pygame.transform.scale_by(sheet.subsurface(src), SCALE).convert_alpha()
+            cache[(sheet_idx, frame_id, 1)] = img
+            cache[(sheet_idx, frame_id, -1)] = pygame.transform.flip(img, True, False).convert_alpha()
+    return cache
+
+# Surfaces the old subsurface/scale_by/flip path would have allocated.
+cache_stats = {"frame": 0, "last_frame": 0, "total": 0}
 
-snd_light = load_sound("punch_light.mp3")
-snd_heavy = load_sound("punch_heavy.mp3")
-snd_jump = load_sound("jump.mp3")
-snd_hit = load_sound("hit.mp3")
-snd_mouse = load_sound("mice.mp3")
-snd_eat = load_sound("eating.mp3")
+def get_frame(sheet_idx, frame, facing):
+    """Return the pre-baked frame; facing -1 is the horizontally flipped one."""
+    frame_id = max(0, min(frame, FRAME_COUNTS[sheet_idx] - 1))
+    cache_stats["frame"] += 3 if facing == -1 else 2
+    return FRAME_CACHE[(sheet_idx, frame_id, facing)]
 
-clock = pygame.time.Clock()
-font  = pygame.font.SysFont("consolas", 32)
+def end_frame_stats():
+    cache_stats["last_frame"] = cache_stats["frame"]
+    cache_stats["total"] += cache_stats["frame"]
+    cache_stats["frame"] = 0
+
+def open_window():
+    """Everything needed to put a first frame up; no files are decoded here."""
+    global WIN, clock, font, text_cache
+    pygame.init()
+    WIN = pygame.display.set_mode((WIN_W, WIN_H))
+    pygame.display.set_caption("Cat Fighter")
+    clock = pygame.time.Clock()
+    font  = pygame.font.SysFont("consolas", 32)
+    text_cache = TextCache(font)
+    sounds.setup()
+
+def read_file(filename):
+    with open(resource_path(filename), "rb") as f:
+        return io.BytesIO(f.read())
+
+class AssetManager:
+    """Decodes the images, sounds and music on a thread pool.
+
+    poll() runs on the main thread: it converts finished images to the display
+    format (that has to happen there), hands finished sounds to `sounds`, and
+    starts the music once the file has been read. `interactive` turns true as
+    soon as the background and both sprite sheets are in, which is all the
+    menu and the fighters need; sounds and music may still follow. An image
+    that fails to load is raised from poll(); a sound or the music is only
+    reported.
+    """
+    IMAGES = {"bg": "bakground.jpg", "cat1": "cat1.png", "cat2": "cat2.png"}
+    SOUNDS = {"light": "punch_light.mp3", "heavy": "punch_heavy.mp3",
+              "jump": "jump.mp3", "hit": "hit.mp3",
+              "mouse": "mice.mp3", "eat": "eating.mp3"}
+    MUSIC = "bgm.mp3"
+
+    def __init__(self, workers=ASSET_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assets")
+        self.pending = {}
+        for name, filename in self.IMAGES.items():
+            self.pending[self.pool.submit(pygame.image.load, resource_path(filename))] = ("image", name)
+        for name, filename in self.SOUNDS.items():
+            self.pending[self.pool.submit(load_sound, filename)] = ("sound", name)
+        self.pending[self.pool.submit(read_file, self.MUSIC)] = ("music", self.MUSIC)
+        self.total = len(self.pending)
+        self.images = {}
+        self.interactive = False
+
+    @property
+    def progress(self):
+        return 1 - len(self.pending) / self.total
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def poll(self):
+        """Install whatever finished loading; returns True once everything is in."""
+        for future in [f for f in self.pending if f.done()]:
+            kind, name = self.pending.pop(future)
+            try:
+                result = future.result()
+            except (OSError, pygame.error) as error:
+                if kind == "image":
+                    # Nothing can be drawn without it: fail loudly, as a missing file always did
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+                print(f"Couldn't load {name}: {error}")
+                continue
+            if kind == "image":
+                self.images[name] = result
+            elif kind == "sound":
+                sounds.add(name, result)
+            else:
+                start_music(result)
+
+        if not self.interactive and len(self.images) == len(self.IMAGES):
+            install_images(self.images["bg"], [self.images["cat1"], self.images["cat2"]])
+            self.interactive = True
+        if self.done:
+            self.pool.shutdown(wait=False)
+        return self.done
+
+    def wait(self):
+        while not self.poll():
+            time.sleep(0.005)
+
+def start_music(data):
+    try:
+        pygame.mixer.music.load(data, "mp3")
+        pygame.mixer.music.set_volume(0.5)  # 0.0 to 1.0 (optional)
+        pygame.mixer.music.play(-1)         # -1 means loop forever
+    except Exception as e:
+        print("Couldn't load background music:", e)
+
+def install_images(bg, sheets):
+    global BG_IMG, SPRITES, FRAME_CACHE, FRAME_COUNTS
+    BG_IMG = pygame.transform.scale(bg.convert(), (WIN_W, WIN_H))
+    SPRITES = [sheet.convert_alpha() for sheet in sheets]
+    # Add this debug code
+    print(f"Sprite 1 size: {SPRITES[0].get_size()}")
+    print(f"Sprite 2 size: {SPRITES[1].get_size()}")
+    FRAME_CACHE = build_frame_cache(SPRITES)
+    FRAME_COUNTS = [sheet.get_width() // FRAME_W for sheet in SPRITES]
+
+def load_assets():
+    """Open the window and load music, images and sounds, blocking until done."""
+    open_window()
+    AssetManager().wait()
+
+def show_loading_screen(assets):
+    """Draw a progress bar until the menu can be used; returns the startup timings."""
+    first_frame = None
+    while not assets.interactive:
+        for e in pygame.event.get():
+            if e.type == pygame.QUIT:
+                pygame.quit(); sys.exit()
+        assets.poll()
+        WIN.fill(BLACK)
+        label = text_cache.render("Loading...", WHITE)
+        WIN.blit(label, label.get_rect(center=(WIN_W//2, WIN_H//2 - 30)))
+        pygame.draw.rect(WIN, WHITE, (WIN_W//2 - 152, WIN_H//2 + 8, 304, 24), 2)
+        pygame.draw.rect(WIN, GREEN, (WIN_W//2 - 150, WIN_H//2 + 10, 300 * assets.progress, 20))
+        pygame.display.flip()
+        if first_frame is None:
+            first_frame = time.perf_counter() - START_TIME
+        clock.tick(FPS)
+    if first_frame is None:  # everything was ready before the first poll
+        first_frame = time.perf_counter() - START_TIME
+    return first_frame, time.perf_counter() - START_TIME
+
+# -------------------------------------------------
+# AI TUNING
+# -------------------------------------------------
+class AIParams:
+    """Knobs for Fighter.ai_control; the defaults are the original hand-tuned values."""
+    def __init__(self, difficulty=AI_DIFFICULTY, near_distance=60, far_distance=100,
+                 retreat_distance=120, recover_jump=0.3, heavy_close=0.7,
+                 light_mid=0.6, counter=0.8, poke=0.4):
+        self.difficulty = difficulty              # chance of deciding anything this frame
+        self.near_distance = near_distance        # optimal distance while health > 50
+        self.far_distance = far_distance          # optimal distance while health <= 50
+        self.retreat_distance = retreat_distance  # optimal distance while health < 30
+        self.recover_jump = recover_jump          # chance to jump away while health < 30
+        self.heavy_close = heavy_close            # winning, close range: heavy attack
+        self.light_mid = light_mid                # winning, mid range: light (else heavy)
+        self.counter = counter                    # losing, opponent on cooldown: heavy
+        self.poke = poke                          # losing otherwise: light
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v}" for k, v in vars(self).items())
+        return f"AIParams({fields})"
 
 # -------------------------------------------------
 # FIGHTER
 # -------------------------------------------------
 class Fighter:
+    __slots__ = ("rect", "vel_y", "health", "sprite_idx", "controls", "facing", "on_ground",
+                 "attack_cd", "frame", "anim_timer", "hurt_timer", "dead", "winner", "eating",
+                 "pending_heal", "damage_dealt", "ai", "rng", "level", "arena", "prev_x", "prev_y")
+
     def __init__(self, x, y, sprite_idx, controls, facing):
         self.rect   = pygame.Rect(x, y, 30, 80)
         self.vel_y  = 0
         self.health = 200  # Changed from 100 to 150
-        self.sprite = SPRITES[sprite_idx]
+        self.sprite_idx = sprite_idx
         self.controls = controls
         self.facing = facing
         self.on_ground = False
@@ -107,6 +473,12 @@ class Fighter:
         self.winner = False
         self.eating = 0
         self.pending_heal = 0  # Add this line for delayed healing
+        self.damage_dealt = 0
+        self.ai = AIParams()
+        self.rng = random  # Match hands every fighter its own seeded Random
+        self.level = LEVEL
+        self.arena = None  # FreeForAll's ArenaHash; attacks then hit whoever is in reach
+        self.prev_x, self.prev_y = x, y  # position before the last step, for drawing
 
     # input -------------------------------------------------
     def handle_input(self, keys, opponent):
@@ -123,7 +495,8 @@ class Fighter:
             self.vel_y = -15
             self.frame = 2
             self.anim_timer = 15
-            if snd_jump: snd_jump.play()
+            sounds.play("jump")
+            telemetry.record(EV_JUMP, self)
         self.rect.x += dx
 
         if self.attack_cd <= 0:
@@ -141,22 +514,30 @@ class Fighter:
             self.rect.centerx + self.facing * reach//2 - reach//2,
             self.rect.y + 20, reach, 40
         )
-        if r.colliderect(opponent.rect) and opponent.take_damage(dmg):
-            if dmg == 10 and snd_light: snd_light.play()
-            elif snd_heavy: snd_heavy.play()
-            opponent.rect.x += self.facing * 10
+        targets = (opponent,) if self.arena is None else self.arena.near(r, self)
+        hit = None
+        for target in targets:
+            lost = target.take_damage(dmg, self) if r.colliderect(target.rect) else None
+            if lost is not None:  # a hit, even one on a cat already at 0 health
+                self.damage_dealt += lost
+                sounds.play("light" if dmg == 10 else "heavy")
+                target.rect.x += self.facing * 10
+                hit = hit or target
+        telemetry.record(EV_ATTACK, self, hit, dmg, reach)
 
     # damage -------------------------------------------------
-    def take_damage(self, amount):
+    def take_damage(self, amount, attacker=None):
+        """Health actually lost (at most what was left), or None if the hit doesn't count."""
         if self.dead or self.winner or amount <= 0:
-            return False
+            return None
 
-        self.health = max(0, self.health - amount)
+        lost = min(self.health, amount)
+        self.health -= lost
         self.hurt_timer = 18
         self.frame = 3
-        if snd_hit:
-            snd_hit.play()
-        return True
+        sounds.play("hit")
+        telemetry.record(EV_DAMAGE, self, attacker, lost, self.health)
+        return lost
 
     # physics -------------------------------------------------
     def physics(self):
@@ -171,20 +552,14 @@ class Fighter:
         self.on_ground = False
 
         # Check platform collisions with more forgiving detection
-        for plat in PLATFORMS:
-            # Only check collision when moving downward
-            if self.vel_y >= 0:
-                # Check if player's feet are at or slightly below platform top
-                # and were above the platform in the previous frame
-                if (self.rect.bottom >= plat.top and 
-                    self.rect.bottom - self.vel_y <= plat.top + 5 and  # More forgiving collision
-                    self.rect.right > plat.left and 
-                    self.rect.left < plat.right):
-                    
-                    self.rect.bottom = plat.top  # Snap to platform
-                    self.vel_y = 0
-                    self.on_ground = True
-                    break
+        # Only check collision when moving downward
+        if self.vel_y >= 0:
+            # Feet at or slightly below a platform top, and above it last frame
+            plat = self.level.landing(self.rect, self.vel_y)
+            if plat is not None:
+                self.rect.bottom = plat.top  # Snap to platform
+                self.vel_y = 0
+                self.on_ground = True
 
         #if self.on_ground:
             #print(f"Player grounded at y={self.rect.bottom}")
@@ -213,19 +588,18 @@ class Fighter:
                 if self.hurt_timer == 0 and not self.winner:  # Add winner check
                     self.frame = 0
             self.handle_input(keys, opponent)
+            profiler.lap("update")
             self.physics()
+            profiler.lap("physics")
 
     # draw -------------------------------------------------
-    def draw(self, surf):
-        # Calculate correct frame ID based on actual sprite sheet width
-        max_frames = self.sprite.get_width() // FRAME_W  # 144/16 = 9 frames
-        frame_id = max(0, min(self.frame, max_frames-1))
-        src = pygame.Rect(frame_id * FRAME_W, 0, FRAME_W, FRAME_H)
-        img = self.sprite.subsurface(src)
-        img = pygame.transform.scale_by(img, SCALE)
-        if self.facing == -1:
-            img = pygame.transform.flip(img, True, False)
-        surf.blit(img, img.get_rect(midbottom=(self.rect.centerx, self.rect.bottom)))
+    def draw(self, surf, alpha=1.0, camera_x=0):
+        # Frame ID is clamped to the sheet width inside get_frame
+        img = get_frame(self.sprite_idx, self.frame, self.facing)
+        # Blend the last two simulation steps: alpha 0 = previous, 1 = current
+        x = round(self.prev_x + (self.rect.x - self.prev_x) * alpha) - camera_x
+        y = round(self.prev_y + (self.rect.y - self.prev_y) * alpha)
+        return surf.blit(img, img.get_rect(midbottom=(x + self.rect.width // 2, y + self.rect.height)))
         # Removed the debug rectangle line:
         # pygame.draw.rect(surf, RED, self.rect, 2)
 
@@ -247,20 +621,22 @@ class Fighter:
                 self.frame = 0
     
         # AI decision making with improved intelligence
-        if random.random() < AI_DIFFICULTY:
+        ai = self.ai
+        if self.rng.random() < ai.difficulty:
             # Dynamic optimal distance based on health
-            optimal_distance = 60 if self.health > 50 else 100
+            optimal_distance = ai.near_distance if self.health > 50 else ai.far_distance
             
             # Defensive behavior when low health
             if self.health < 30:
-                optimal_distance = 120  # Stay further away when hurt
+                optimal_distance = ai.retreat_distance  # Stay further away when hurt
                 
                 # Try to jump to higher platforms to recover
-                if self.on_ground and random.random() < 0.3:
+                if self.on_ground and self.rng.random() < ai.recover_jump:
                     self.vel_y = -15
                     self.frame = 2
                     self.anim_timer = 15
-                    if snd_jump: snd_jump.play()
+                    sounds.play("jump")
+                    telemetry.record(EV_JUMP, self)
         
             # Movement logic
             if abs(dist_x) > optimal_distance:
@@ -277,13 +653,15 @@ class Fighter:
                     self.vel_y = -15
                     self.frame = 2
                     self.anim_timer = 15
-                    if snd_jump: snd_jump.play()
+                    sounds.play("jump")
+                    telemetry.record(EV_JUMP, self)
                 # Jump to dodge if opponent is attacking and close
                 elif abs(dist_x) < 60 and opponent.frame == 1:
                     self.vel_y = -15
                     self.frame = 2
                     self.anim_timer = 15
-                    if snd_jump: snd_jump.play()
+                    sounds.play("jump")
+                    telemetry.record(EV_JUMP, self)
         
             # Enhanced attack strategy
             if self.attack_cd <= 0:
@@ -291,20 +669,20 @@ class Fighter:
                     if self.health > opponent.health:  # Winning - be aggressive
                         if abs(dist_x) < 50:
                             # Close range - prefer heavy attacks
-                            if random.random() < 0.7:
+                            if self.rng.random() < ai.heavy_close:
                                 self.attack(opponent, 25, 40, 15, 35)  # Heavy attack
                         else:
                             # Medium range - mix attacks
-                            if random.random() < 0.6:
+                            if self.rng.random() < ai.light_mid:
                                 self.attack(opponent, 10, 50, 8, 15)
                             else:
                                 self.attack(opponent, 25, 40, 15, 35)
                     else:  # Losing - be more tactical
                         # Counter-attack when opponent is vulnerable
                         if opponent.attack_cd > 0:
-                            if random.random() < 0.8:
+                            if self.rng.random() < ai.counter:
                                 self.attack(opponent, 25, 40, 15, 35)
-                        elif random.random() < 0.4:
+                        elif self.rng.random() < ai.poke:
                             self.attack(opponent, 10, 50, 8, 15)
     
         # Apply movement
@@ -322,45 +700,114 @@ class Fighter:
             # Calculate healing based on max health of 200
             missing_health = 200 - self.health  # Changed from 100 to 200
             self.pending_heal = missing_health // 2
-            if snd_mouse: 
-                snd_mouse.stop()
-            if snd_eat: 
-                snd_eat.play()
+            # The squeak loop is stopped by MousePool once no mouse is left
+            sounds.play("eat")
+            telemetry.record(EV_HEAL, self, None, self.pending_heal, self.health)
             return True
         return False
 
 class Mouse:
-    def __init__(self, from_right):
-        # Start position based on direction
-        self.rect = pygame.Rect(
-            WIN_W + 20 if from_right else -20,  # Start position
-            GROUND_Y - 20,  # Ground level
-            20, 20  # Size
-        )
-        self.direction = -1 if from_right else 1
+    __slots__ = ("rect", "direction", "frame", "prev_x", "end")
+
+    def __init__(self, from_right=False):
+        self.rect = pygame.Rect(0, GROUND_Y - 20, 20, 20)  # Ground level, 20x20
         self.frame = 6  # Mouse sprite frame
-        print(f"Mouse initialized: direction={self.direction}, x={self.rect.x}")
-        if snd_mouse:
-            snd_mouse.play(-1)
-    
-    def draw(self, surf):
-        # Get mouse sprite from the first sprite sheet
-        src = pygame.Rect(6 * FRAME_W, 0, FRAME_W, FRAME_H)
-        img = SPRITES[0].subsurface(src)
-        img = pygame.transform.scale_by(img, SCALE)
-        # Flip if moving right (direction = 1) instead of left
-        if self.direction == 1:  # Changed condition from -1 to 1
-            img = pygame.transform.flip(img, True, False)
-        surf.blit(img, img.get_rect(midbottom=(self.rect.centerx, self.rect.bottom)))
+        self.reset(from_right)
+
+    def reset(self, from_right, left=0, right=WIN_W):
+        # Start just off one side of the left..right stretch, run off the other
+        self.rect.x = self.prev_x = right + 20 if from_right else left - 20
+        self.direction = -1 if from_right else 1
+        self.end = left - 20 if from_right else right + 20
+
+class MousePool:
+    """Every mouse a match can have, allocated up front and reused.
+
+    active and rects are kept in the same order; rects is handed straight to
+    Rect.collidelist so the overlap test against each fighter runs in C. The
+    squeak loop plays while at least one mouse is out.
+    """
+    def __init__(self, capacity=1):
+        self.capacity = capacity
+        self.free = [Mouse() for _ in range(capacity)]
+        self.active = []
+        self.rects = []
+
+    def __len__(self):
+        return len(self.active)
+
+    def spawn(self, from_right, span=(0, WIN_W)):
+        if not self.free:
+            return None
+        mouse = self.free.pop()
+        mouse.reset(from_right, *span)
+        self.active.append(mouse)
+        self.rects.append(mouse.rect)
+        if len(self.active) == 1:
+            sounds.loop("mouse")
+        return mouse
+
+    def _release(self, index):
+        self.free.append(self.active.pop(index))
+        self.rects.pop(index)
+        if not self.active:
+            sounds.stop_loop()
+
+    def clear(self):
+        while self.active:
+            self._release(len(self.active) - 1)
 
     def update(self):
-        # Update position based on direction
-        self.rect.x += self.direction * MOUSE_SPEED
-        # Check if off screen
-        off_screen = self.rect.right < -20 or self.rect.left > WIN_W + 20
-        if off_screen and snd_mouse:
-            snd_mouse.stop()
-        return off_screen
+        """Move every mouse; the ones that ran past their end go back to the pool."""
+        active, rects, keep = self.active, self.rects, 0
+        for mouse in active:
+            rect = mouse.rect
+            mouse.prev_x = rect.x
+            rect.x += mouse.direction * MOUSE_SPEED
+            if rect.right < mouse.end if mouse.direction < 0 else rect.left > mouse.end:
+                self.free.append(mouse)
+            else:
+                active[keep] = mouse
+                rects[keep] = rect
+                keep += 1
+        if keep < len(active):
+            del active[keep:]
+            del rects[keep:]
+            if not active:
+                sounds.stop_loop()
+
+    def feed(self, fighters):
+        """Each fighter that isn't already eating eats the first mouse it touches."""
+        for fighter in fighters:
+            if not self.active:
+                return
+            if fighter.eating:
+                continue
+            hit = fighter.rect.collidelist(self.rects)
+            if hit != -1:
+                fighter.eat_mouse()
+                self._release(hit)
+
+    def draw(self, surf, alpha=1.0, camera_x=0):
+        """Blit every mouse in one blits() call; returns the rects touched."""
+        # Mouse sprite lives on the first sheet, flipped when moving right
+        # (same spot as midbottom=(rect.centerx, rect.bottom); mice never leave the ground)
+        offset_x, top = 20 // 2 - FRAME_W * SCALE // 2 - camera_x, GROUND_Y - FRAME_H * SCALE
+        return surf.blits([(get_frame(0, m.frame, -m.direction),
+                            (round(m.prev_x + (m.rect.x - m.prev_x) * alpha) + offset_x, top))
+                           for m in self.active])
+
+    def restore(self, mice):
+        """Put back (x, direction, end) mice from a snapshot (silently, like Match.restore)."""
+        self.free.extend(self.active)
+        self.active.clear()
+        self.rects.clear()
+        for x, direction, end in mice:
+            mouse = self.free.pop()
+            mouse.rect.x = mouse.prev_x = x
+            mouse.direction, mouse.end = direction, end
+            self.active.append(mouse)
+            self.rects.append(mouse.rect)
 
 # -------------------------------------------------
 # UTILS
@@ -369,9 +816,10 @@ def health_bar(surf, x, y, pct):
     # Convert health to percentage based on max health of 150
     pct = (pct / 200) * 100
     pct = max(min(pct, 100), 0)
-    pygame.draw.rect(surf, BLACK, (x-2, y-2, 204, 24))
+    outline = pygame.draw.rect(surf, BLACK, (x-2, y-2, 204, 24))
     pygame.draw.rect(surf, RED,   (x, y, 200, 20))
     pygame.draw.rect(surf, GREEN, (x, y, 200 * pct / 100, 20))
+    return outline
 
 def reset():
     # Spawn players exactly at ground level
@@ -385,93 +833,189 @@ def reset():
 
 # Add to UTILS section
 def draw_menu(surf):
-    title = font.render("Cat Fighter", True, BLACK)
-    option1 = font.render("Press 1 for Single Player", True, BLACK)
-    option2 = font.render("Press 2 for Two Players", True, BLACK)
+    title = text_cache.render("Cat Fighter", BLACK)
+    option1 = text_cache.render("Press 1 for Single Player", BLACK)
+    option2 = text_cache.render("Press 2 for Two Players", BLACK)
+    option3 = text_cache.render("Press 3 for Mouse Swarm", BLACK)
+    option4 = text_cache.render("Press 4 for Hard AI", BLACK)
+    option5 = text_cache.render("Press 5 for Free-for-all", BLACK)
     
     surf.blit(title, title.get_rect(center=(WIN_W//2, WIN_H//3)))
     surf.blit(option1, option1.get_rect(center=(WIN_W//2, WIN_H//2)))
     surf.blit(option2, option2.get_rect(center=(WIN_W//2, WIN_H//2 + 50)))
+    surf.blit(option3, option3.get_rect(center=(WIN_W//2, WIN_H//2 + 100)))
+    surf.blit(option4, option4.get_rect(center=(WIN_W//2, WIN_H//2 + 150)))
+    surf.blit(option5, option5.get_rect(center=(WIN_W//2, WIN_H//2 + 200)))
 
 # Add to UTILS section
 def is_anyone_eating(players):
     return any(p.eating > 0 for p in players)
 
-def resolve_match(p1, p2, current_result):
-    """Resolve a knockout once, after both fighters have updated for the frame."""
-    if current_result is not None:
-        return current_result
+def keep_together(fighters, level):
+    """On a level wider than the window, pull the outermost standing fighters
+    back towards each other so they always fit on screen together."""
+    if level.width <= WIN_W:
+        return
+    standing = [f for f in fighters if not f.dead]
+    if len(standing) < 2:
+        return
+    left = min(standing, key=lambda f: f.rect.left)
+    right = max(standing, key=lambda f: f.rect.right)
+    excess = right.rect.right - left.rect.left - WIN_W
+    if excess > 0:
+        right.rect.x -= excess // 2
+        left.rect.x += excess - excess // 2
 
-    p1_knocked_out = p1.health <= 0
-    p2_knocked_out = p2.health <= 0
+def mouse_span(level, fighters):
+    """Stretch of ground new mice cross: the whole stage, or on a level wider
+    than the window, a window's width around the standing fighters."""
+    if level.width <= WIN_W:
+        return 0, WIN_W
+    xs = [f.rect.centerx for f in fighters if not f.dead] or [f.rect.centerx for f in fighters]
+    left = max(0, min((min(xs) + max(xs)) // 2 - WIN_W // 2, level.width - WIN_W))
+    return left, left + WIN_W
 
-    if not p1_knocked_out and not p2_knocked_out:
-        return None
+def resolve_knockouts(fighters, current_result):
+    """Resolve knockouts once, after every fighter has updated for the frame.
 
-    if p1_knocked_out:
-        p1.health = 0
-        p1.dead = True
-        p1.winner = False
-        p1.frame = 4
+    Returns None while more than one fighter stands, else "draw" or
+    "player<n>" for the last one standing (n counts from 1).
+    """
+    if current_result is not None:
+        return current_result
 
-    if p2_knocked_out:
-        p2.health = 0
-        p2.dead = True
-        p2.winner = False
-        p2.frame = 4
+    for f in fighters:
+        if f.health <= 0:
+            f.health = 0
+            f.dead = True
+            f.winner = False
+            f.frame = 4
 
-    if p1_knocked_out and p2_knocked_out:
+    standing = [i for i, f in enumerate(fighters) if not f.dead]
+    if len(standing) > 1:
+        return None
+    if not standing:
+        telemetry.result(fighters, None)
         return "draw"
 
-    winner = p2 if p1_knocked_out else p1
+    winner = fighters[standing[0]]
     winner.winner = True
     winner.frame = 5
     winner.anim_timer = max(winner.anim_timer, 30)
-    return "player2" if p1_knocked_out else "player1"
+    telemetry.result(fighters, winner)
+    return f"player{standing[0] + 1}"
 
-p1, p2 = reset()
-match_result = None
+def resolve_match(p1, p2, current_result):
+    """Resolve a knockout once, after both fighters have updated for the frame."""
+    return resolve_knockouts((p1, p2), current_result)
 
-# Add after p1, p2 = reset()
-current_mouse = None
+# -------------------------------------------------
+# MATCH (simulation core)
+# -------------------------------------------------
+class KeyState:
+    """Stand-in for pygame.key.get_pressed() built from a set of held keys."""
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
 
-# Replace the main game loop
-while True:
-    for e in pygame.event.get():
-        if e.type == pygame.QUIT or (e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
-            pygame.quit(); sys.exit()
-        if e.type == pygame.KEYDOWN:
-            if e.key == pygame.K_F1:
-                p1, p2 = reset()
-                match_result = None
-                GAME_STATE = "menu"
-            elif GAME_STATE == "menu":
-                if e.key == pygame.K_1:
-                    GAME_STATE = "1player"
-                    p1, p2 = reset()
-                    match_result = None
-                elif e.key == pygame.K_2:
-                    GAME_STATE = "2player"
-                    p1, p2 = reset()
-                    match_result = None
-
-    # Draw background
-    WIN.blit(BG_IMG, (0, 0))
-
-    if GAME_STATE == "menu":
-        draw_menu(WIN)
-    else:
-        keys = pygame.key.get_pressed()
-        
-        if match_result is None:
+    def __getitem__(self, key):
+        return key in self.pressed
+
+NO_KEYS = KeyState()
+
+# The ten control keys as a bitmask: p1's five in bits 0-4, p2's in bits 5-9
+CONTROL_NAMES = ("left", "right", "jump", "light", "heavy")
+
+def keys_to_bits(keys, fighters):
+    bits = 0
+    for shift, fighter in zip((0, 5), fighters):
+        for bit, name in enumerate(CONTROL_NAMES):
+            if keys[fighter.controls[name]]:
+                bits |= 1 << (shift + bit)
+    return bits
+
+def bits_to_keys(bits, fighters):
+    pressed = set()
+    for shift, fighter in zip((0, 5), fighters):
+        for bit, name in enumerate(CONTROL_NAMES):
+            if bits & (1 << (shift + bit)):
+                pressed.add(fighter.controls[name])
+    return KeyState(pressed)
+
+# Everything about a fighter that changes during a match
+FIGHTER_STATE = ("vel_y", "health", "facing", "on_ground", "attack_cd", "frame",
+                 "anim_timer", "hurt_timer", "dead", "winner", "eating",
+                 "pending_heal", "damage_dealt")
+get_fighter_state = operator.attrgetter(*FIGHTER_STATE)
+
+# Match.snapshot() layout (little endian): frame, result, mouse count, the
+# Mersenne Twister state (624 words + index) and its cached gauss, then per
+# fighter rect.x, rect.y and FIGHTER_STATE, then every mouse slot's x,
+# direction and end (unused slots are zero), so the size only depends on the
+# capacity.
+MATCH_RESULTS = (None, "player1", "player2", "draw")
+MATCH_HEADER = "IBH"
+RNG_WORDS = 625
+FIGHTER_FORMAT = "iidib?ibii??iii"
+
+class Match:
+    """Both fighters, the mice and the KO result, advanced one frame per step().
+
+    mode is "1player" (p2 is the AI), "2player", "ai" (both fighters are AI),
+    "swarm" (like 1player, but with up to SWARM_MICE mice at once) or "hard"
+    (p2 plays from the keys too, pressed by a LookaheadAI; see plan_keys()).
+    All randomness (AI decisions and mouse spawns) comes from one Random seeded
+    with seed, so a match replays exactly for the same seed and inputs. ai is an
+    optional (p1, p2) pair of AIParams; level defaults to LEVEL (or can be an
+    arena.ChunkedLevel many screens wide).
+    Nothing in here draws; sounds only play if load_assets() has run.
+    """
+    def __init__(self, mode="1player", seed=None, ai=None, level=None):
+        self.mode = mode
+        self.level = level or LEVEL
+        # Always settle on a concrete seed so the match can be recorded
+        self.seed = random.randrange(2**63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.p1, self.p2 = reset()
+        for fighter, params in zip((self.p1, self.p2), ai or ()):
+            fighter.ai = params
+        self.p1.rng = self.p2.rng = self.rng
+        self.p1.level = self.p2.level = self.level
+        self.result = None
+        self.swarm = mode == "swarm"
+        self.mice = MousePool(SWARM_MICE if self.swarm else 1)
+        self.spawn_chance = SWARM_SPAWN_CHANCE if self.swarm else MOUSE_SPAWN_CHANCE
+        self.frame = 0
+        capacity = self.mice.capacity
+        self.state_struct = struct.Struct(f"<{MATCH_HEADER}{RNG_WORDS}I?d"
+                                          f"{FIGHTER_FORMAT * 2}{capacity}i{capacity}b{capacity}i")
+
+    @property
+    def fighters(self):
+        return (self.p1, self.p2)
+
+    def step(self, keys=NO_KEYS):
+        p1, p2 = self.p1, self.p2
+        self.frame += 1
+        for f in (p1, p2):
+            f.prev_x, f.prev_y = f.rect.x, f.rect.y
+
+        if self.result is None:
             # Only allow updates if no one is eating
             if not is_anyone_eating([p1, p2]):
-                p1.update(keys, p2)
-                if GAME_STATE == "2player":
+                if self.mode == "ai":
+                    p1.ai_control(p2)
+                    profiler.lap("update")
+                    p1.physics()
+                    profiler.lap("physics")
+                else:
+                    p1.update(keys, p2)
+                if self.mode in ("2player", "hard"):
                     p2.update(keys, p1)
-                else:  # 1player mode
+                else:  # AI controls p2
                     p2.ai_control(p1)
+                    profiler.lap("update")
                     p2.physics()
+                    profiler.lap("physics")
             else:
                 # If someone is eating, only update eating animations
                 if p1.eating > 0:
@@ -480,66 +1024,1018 @@ while True:
                     p2.update(keys, p1)
 
             # Resolve both health values together, once per frame.
-            match_result = resolve_match(p1, p2, match_result)
-            if match_result is not None and current_mouse:
-                if snd_mouse:
-                    snd_mouse.stop()
-                current_mouse = None
-
-        # Mouse spawning
-        if match_result is None and not current_mouse and not p1.eating and not p2.eating:
-            if random.random() < MOUSE_SPAWN_CHANCE:
-                from_right = bool(random.randrange(2))
-                current_mouse = Mouse(from_right)
-        
+            self.result = resolve_match(p1, p2, self.result)
+            if self.result is not None:
+                self.mice.clear()
+            profiler.lap("update")
+
+        # Mouse spawning (a swarm keeps coming even while someone eats)
+        mice = self.mice
+        if (self.result is None and len(mice) < mice.capacity
+                and (self.swarm or not (p1.eating or p2.eating))):
+            if self.rng.random() < self.spawn_chance:
+                from_right = bool(self.rng.randrange(2))
+                mice.spawn(from_right, mouse_span(self.level, (p1, p2)))
+
         # Mouse update
-        if match_result is None and current_mouse:
-            if current_mouse.update():
-                current_mouse = None
-            else:
-                # Check collision with players
-                for player in (p1, p2):
-                    if not player.eating and current_mouse.rect.colliderect(player.rect):
-                        player.eat_mouse()
-                        current_mouse = None
-                        break
-
-        # Draw mouse if exists
-        if current_mouse:
-            current_mouse.draw(WIN)  # Replace the gray rectangle with sprite
-
-        # --- DRAW EVERYTHING ---
-        # black floor
-        pygame.draw.rect(WIN, BLACK, (0, GROUND_Y, WIN_W, WIN_H - GROUND_Y))
-        # platforms
-        for plat in PLATFORMS:
-            pygame.draw.rect(WIN, BLACK, plat)
-            
-        # Draw mouse if exists
-        if current_mouse:
-            current_mouse.draw(WIN)
-            
-        # Draw players
-        p1.draw(WIN)
-        p2.draw(WIN)
-        # Debug position logs - commented out
-        #print(f"P1: y={p1.rect.bottom} ground={GROUND_Y}")
-        #print(f"P2: y={p2.rect.bottom} ground={GROUND_Y}")
-        health_bar(WIN, 20, 20, p1.health)
-        health_bar(WIN, WIN_W-220, 20, p2.health)
-
-        if match_result is not None:
-            if match_result == "draw":
-                message = "DOUBLE K.O. - DRAW  F1 = restart"
+        if self.result is None and mice.active:
+            mice.update()
+            # Check collision with players
+            mice.feed((p1, p2))
+
+        # keep cats inside the level, and on one screen together
+        for f in (p1, p2):
+            f.rect.x = max(0, min(f.rect.x, self.level.width - f.rect.width))
+        keep_together((p1, p2), self.level)
+        profiler.lap("mice")
+        return self.result
+
+    def snapshot(self):
+        """Everything step() changes, packed into state_struct.size bytes."""
+        _, internal, gauss = self.rng.getstate()
+        p1, p2, mice = self.p1, self.p2, self.mice.active
+        pad = (0,) * (self.mice.capacity - len(mice))
+        return self.state_struct.pack(
+            self.frame, MATCH_RESULTS.index(self.result), len(mice),
+            *internal, gauss is not None, gauss or 0.0,
+            p1.rect.x, p1.rect.y, *get_fighter_state(p1),
+            p2.rect.x, p2.rect.y, *get_fighter_state(p2),
+            *[m.rect.x for m in mice], *pad, *[m.direction for m in mice], *pad,
+            *[m.end for m in mice], *pad)
+
+    def restore(self, state):
+        values = self.state_struct.unpack(state)
+        self.frame, result, count = values[:3]
+        self.result = MATCH_RESULTS[result]
+        i = 3 + RNG_WORDS
+        has_gauss, gauss = values[i:i + 2]
+        self.rng.setstate((3, values[3:i], gauss if has_gauss else None))
+        i += 2
+        for f in (self.p1, self.p2):
+            f.rect.x, f.rect.y = f.prev_x, f.prev_y = values[i], values[i + 1]
+            for name, value in zip(FIGHTER_STATE, values[i + 2:]):
+                setattr(f, name, value)
+            i += 2 + len(FIGHTER_STATE)
+        capacity = self.mice.capacity
+        self.mice.restore(zip(values[i:i + count], values[i + capacity:i + capacity + count],
+                              values[i + 2 * capacity:i + 2 * capacity + count]))
+
+# -------------------------------------------------
+# FREE-FOR-ALL
+# -------------------------------------------------
+class ArenaHash:
+    """Standing fighters filed under the grid cells their rects cover.
+
+    Rebuilt once per step; near() looks one cell further out than the rect
+    reaches, so fighters that moved (or got knocked back) by less than a cell
+    since the rebuild are still found. Callers do the exact overlap test.
+    """
+    def __init__(self, cell=ARENA_CELL):
+        self.cell = cell
+        self.cells = {}
+
+    def rebuild(self, fighters):
+        cell, cells = self.cell, {}
+        for f in fighters:
+            if f.dead:
+                continue
+            r = f.rect
+            for col in range(r.left // cell, (r.right - 1) // cell + 1):
+                for row in range(r.top // cell, (r.bottom - 1) // cell + 1):
+                    cells.setdefault((col, row), []).append(f)
+        self.cells = cells
+
+    def near(self, rect, exclude=None):
+        """Fighters that may overlap rect, each once, in a repeatable order."""
+        cell, found, seen = self.cell, [], set()
+        for col in range(rect.left // cell - 1, (rect.right - 1) // cell + 2):
+            for row in range(rect.top // cell - 1, (rect.bottom - 1) // cell + 2):
+                for f in self.cells.get((col, row), ()):
+                    if f is not exclude and f not in seen:
+                        seen.add(f)
+                        found.append(f)
+        return found
+
+class FreeForAll:
+    """count cats on one stage, everyone against everyone; steps like a Match.
+
+    The first humans fighters play from the keys (player 1's controls, then
+    player 2's), the rest are AI and go after their nearest standing neighbour
+    along x. Attacks find their victims through an ArenaHash instead of
+    testing every pair. Nobody freezes while another cat eats. result is
+    "player<n>" for the last cat standing (counting from 1) or "draw".
+    """
+    def __init__(self, count=FFA_FIGHTERS, humans=1, seed=None, level=None):
+        self.mode = "ffa"
+        self.level = level or LEVEL
+        self.seed = random.randrange(2**63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.arena = ArenaHash()
+        self.humans = min(humans, 2)  # there are only two sets of controls
+        controls = [f.controls for f in reset()]
+        self.fighters = []
+        for i in range(count):
+            x = 20 + (WIN_W - 70) * i // max(1, count - 1)
+            f = Fighter(x, GROUND_Y - 80, i % 2, controls[i] if i < min(humans, 2) else {},
+                        1 if x < WIN_W // 2 else -1)
+            f.rng, f.level, f.arena = self.rng, self.level, self.arena
+            self.fighters.append(f)
+        self.result = None
+        self.mice = MousePool(FFA_MICE)
+        self.spawn_chance = FFA_SPAWN_CHANCE
+        self.frame = 0
+
+    @property
+    def p1(self):
+        return self.fighters[0]
+
+    def targets(self):
+        """Each standing fighter's nearest standing neighbour along x."""
+        standing = sorted((f for f in self.fighters if not f.dead), key=lambda f: f.rect.centerx)
+        targets = {}
+        for i, f in enumerate(standing):
+            left = standing[i - 1] if i > 0 else None
+            right = standing[i + 1] if i + 1 < len(standing) else None
+            if left is None or (right is not None and
+                                right.rect.centerx - f.rect.centerx < f.rect.centerx - left.rect.centerx):
+                targets[f] = right
             else:
-                winner_name = "Player 1" if match_result == "player1" else "Player 2"
-                message = f"{winner_name} wins!  F1 = restart"
-            txt = font.render(message, True, BLACK)
-            WIN.blit(txt, txt.get_rect(center=(WIN_W//2, WIN_H//2)))
+                targets[f] = left
+        return targets
+
+    def step(self, keys=NO_KEYS):
+        fighters = self.fighters
+        self.frame += 1
+        for f in fighters:
+            f.prev_x, f.prev_y = f.rect.x, f.rect.y
+
+        if self.result is None:
+            self.arena.rebuild(fighters)
+            targets = self.targets()
+            for i, f in enumerate(fighters):
+                target = targets.get(f)
+                if target is None:
+                    continue  # down (or, briefly, the only one left)
+                if i < self.humans or f.eating:
+                    f.update(keys, target)  # eating cats only play the animation
+                else:
+                    f.ai_control(target)
+                    profiler.lap("update")
+                    f.physics()
+                    profiler.lap("physics")
+            self.result = resolve_knockouts(fighters, self.result)
+            if self.result is not None:
+                self.mice.clear()
+            profiler.lap("update")
+
+        mice = self.mice
+        if self.result is None:
+            if len(mice) < mice.capacity and self.rng.random() < self.spawn_chance:
+                mice.spawn(bool(self.rng.randrange(2)), mouse_span(self.level, fighters))
+            if mice.active:
+                mice.update()
+                mice.feed([f for f in fighters if not f.dead])
 
-    # keep cats inside screen
-    for f in (p1, p2):
-        f.rect.x = max(0, min(f.rect.x, WIN_W - f.rect.width))
+        for f in fighters:
+            f.rect.x = max(0, min(f.rect.x, self.level.width - f.rect.width))
+        keep_together(fighters[:self.humans], self.level)
+        profiler.lap("mice")
+        return self.result
 
-    pygame.display.flip()
-    clock.tick(FPS)  # Make sure this line is present
+# -------------------------------------------------
+# LOOKAHEAD AI
+# -------------------------------------------------
+# Plans are LOOKAHEAD_FRAMES key masks for p2 (CONTROL_NAMES order): one
+# action held until LOOKAHEAD_SWITCH, then another one to the end.
+PLAN_ACTIONS = (0, 1, 2, 4, 5, 6, 8, 16, 9, 10, 17, 18)  # idle, moves, jumps, punches
+
+def plan_score(match, start_margin):
+    """How much better p2 stands than at the start: health margin, KOs, and staying in reach."""
+    p1, p2 = match.p1, match.p2
+    if match.result == "player2":
+        return 1000
+    if match.result in ("player1", "draw"):
+        return -1000
+    margin = (p2.health + p2.pending_heal) - (p1.health + p1.pending_heal)
+    return margin - start_margin - 0.05 * abs(abs(p1.rect.centerx - p2.rect.centerx) - 40)
+
+class LookaheadAI:
+    """Anytime planner for p2 in a "hard" match, thinking on a worker thread.
+
+    After every step the main thread hands over the match state with
+    observe(). The worker restores it into a private Match and plays
+    candidate plans forward with the real rules, assuming p1 keeps holding
+    the keys it holds now, until budget seconds have passed; then it publishes
+    the best plan found and sleeps until the next state. The previous best
+    plan (shifted to the new frame) is always scored first, and the other
+    candidates are taken in turn across frames, so every one gets looked at
+    and a deadline never leaves it worse off than before. plan_keys() never
+    waits: it presses whatever the latest plan says for the frame at hand.
+    """
+    def __init__(self, match, budget=LOOKAHEAD_BUDGET, horizon=LOOKAHEAD_FRAMES,
+                 switch=LOOKAHEAD_SWITCH):
+        self.budget, self.horizon = budget, horizon
+        self.sim = Match(match.mode, level=match.level)  # only the worker touches this
+        self.candidates = [(first,) * switch + (second,) * (horizon - switch)
+                           for first in PLAN_ACTIONS for second in PLAN_ACTIONS]
+        self.next_candidate = 0
+        self.keystates = {}
+        self.best = (match.frame, (0,) * horizon)  # (frame it starts at, masks)
+        self.stats = {"searches": 0, "rollouts": 0}
+        self.wake = threading.Condition()
+        self.state = None  # (frame, snapshot, p1 mask), newest only
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="lookahead", daemon=True)
+        self.thread.start()
+
+    def observe(self, match, keys):
+        state = (match.frame, match.snapshot(), keys_to_bits(keys, (match.p1,)))
+        with self.wake:
+            self.state = state
+            self.wake.notify()
+
+    def plan_keys(self, keys, match):
+        """keys with p2's controls pressed as the current plan says."""
+        start, plan = self.best
+        offset = match.frame - start
+        bits = plan[offset] if 0 <= offset < len(plan) else 0
+        return bits_to_keys(keys_to_bits(keys, (match.p1,)) | bits << 5, (match.p1, match.p2))
+
+    def stop(self):
+        with self.wake:
+            self.running = False
+            self.wake.notify()
+
+    def run(self):
+        while True:
+            with self.wake:
+                while self.running and self.state is None:
+                    self.wake.wait()
+                if not self.running:
+                    return
+                (frame, state, opponent), self.state = self.state, None
+            self.best = (frame, self.search(frame, state, opponent))
+
+    def search(self, frame, state, opponent):
+        deadline = time.perf_counter() + self.budget
+        self.stats["searches"] += 1
+        sim = self.sim
+        sim.restore(state)
+        start_margin = ((sim.p2.health + sim.p2.pending_heal) -
+                        (sim.p1.health + sim.p1.pending_heal))
+
+        start, plan = self.best
+        shift = max(0, frame - start)
+        previous = plan[shift:] + (plan[-1],) * min(shift, len(plan))
+        best_plan, best_score = previous, self.rollout(state, previous, opponent, start_margin)
+        for _ in range(len(self.candidates)):
+            if time.perf_counter() >= deadline:
+                break
+            plan = self.candidates[self.next_candidate]
+            self.next_candidate = (self.next_candidate + 1) % len(self.candidates)
+            score = self.rollout(state, plan, opponent, start_margin)
+            if score > best_score:
+                best_plan, best_score = plan, score
+            time.sleep(0)  # let the main thread have the GIL between rollouts
+        return best_plan
+
+    def rollout(self, state, plan, opponent, start_margin):
+        sim, keystates = self.sim, self.keystates
+        sim.restore(state)
+        self.stats["rollouts"] += 1
+        for bits in plan:
+            mask = opponent | bits << 5
+            keys = keystates.get(mask)
+            if keys is None:
+                keys = keystates[mask] = bits_to_keys(mask, (sim.p1, sim.p2))
+            if sim.step(keys) is not None:
+                break
+        return plan_score(sim, start_margin)
+
+# -------------------------------------------------
+# LAYERS
+# -------------------------------------------------
+# Three layers sit under the moving sprites: a static screen composited once
+# (stage or menu), text surfaces rendered once per (string, color), and HUD
+# widgets that only repaint when their value changes.
+class TextCache:
+    """font.render results keyed by (text, color); least recently used go first."""
+    def __init__(self, font, size=TEXT_CACHE_SIZE):
+        self.font = font
+        self.size = size
+        self.surfaces = OrderedDict()
+        self.hits = self.misses = 0
+
+    def render(self, text, color):
+        key = (text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            self.misses += 1
+            surface = self.surfaces[key] = self.font.render(text, True, color).convert_alpha()
+            if len(self.surfaces) > self.size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+        return surface
+
+def draw_stage():
+    """Background with the black floor and the platforms already drawn on it."""
+    stage = BG_IMG.copy()
+    # black floor
+    pygame.draw.rect(stage, BLACK, (0, GROUND_Y, WIN_W, WIN_H - GROUND_Y))
+    # platforms
+    for plat in LEVEL:
+        pygame.draw.rect(stage, BLACK, plat)
+    return stage
+
+def draw_menu_screen():
+    screen = BG_IMG.copy()
+    draw_menu(screen)
+    return screen
+
+class HealthBar:
+    """health_bar() that is skipped while the health is unchanged and nothing drew over it."""
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+        self.rect = pygame.Rect(x-2, y-2, 204, 24)
+        self.value = None
+
+    def draw(self, surf, health, damaged):
+        if health == self.value and self.rect.collidelist(damaged) == -1:
+            return None
+        self.value = health
+        return health_bar(surf, self.x, self.y, health)
+
+class Message:
+    """Centered line of text, redrawn only when the text changes or it gets drawn over."""
+    def __init__(self, center):
+        self.center = center
+        self.value = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def draw(self, surf, text, damaged):
+        if text == self.value and self.rect.collidelist(damaged) == -1:
+            return None
+        self.value = text
+        if text is None:
+            self.rect = pygame.Rect(0, 0, 0, 0)
+            return None
+        txt = text_cache.render(text, BLACK)
+        self.rect = surf.blit(txt, txt.get_rect(center=self.center))
+        return self.rect
+
+class Hud:
+    def __init__(self):
+        self.bars = (HealthBar(20, 20), HealthBar(WIN_W-220, 20))
+        self.message = Message((WIN_W//2, WIN_H//2))
+
+    def draw(self, surf, match, damaged):
+        dirty = [bar.draw(surf, f.health, damaged) for bar, f in zip(self.bars, (match.p1, match.p2))]
+        dirty.append(self.message.draw(surf, result_message(match.result), damaged))
+        return [r for r in dirty if r]
+
+class RosterHud:
+    """Free-for-all HUD: a strip of small health bars, one per cat, player 1's outlined in white.
+
+    The strip is redrawn whole, only when some health changed or something
+    drew over it.
+    """
+    COLUMNS = 16
+
+    def __init__(self, count, humans=1):
+        self.count, self.humans = count, humans
+        self.bar_w = (WIN_W - 40) // min(count, self.COLUMNS) - 4
+        rows = -(-count // self.COLUMNS)
+        self.rect = pygame.Rect(18, 8, WIN_W - 36, rows * 10 + 2)
+        self.values = None
+        self.message = Message((WIN_W//2, WIN_H//2))
+
+    def draw(self, surf, match, damaged):
+        dirty = []
+        healths = tuple(f.health for f in match.fighters)
+        if healths != self.values or self.rect.collidelist(damaged) != -1:
+            self.values = healths
+            for i, health in enumerate(healths):
+                x = 20 + (i % self.COLUMNS) * (self.bar_w + 4)
+                y = 10 + (i // self.COLUMNS) * 10
+                pygame.draw.rect(surf, WHITE if i < self.humans else BLACK, (x - 1, y - 1, self.bar_w + 2, 8))
+                pygame.draw.rect(surf, RED, (x, y, self.bar_w, 6))
+                pygame.draw.rect(surf, GREEN, (x, y, self.bar_w * max(0, min(health, 200)) // 200, 6))
+            dirty.append(self.rect)
+        message = self.message.draw(surf, result_message(match.result), damaged)
+        if message:
+            dirty.append(message)
+        return dirty
+
+def result_message(result):
+    if result is None:
+        return None
+    if result == "draw":
+        return "DOUBLE K.O. - DRAW  F1 = restart"
+    return f"Player {result.removeprefix('player')} wins!  F1 = restart"
+
+def draw_match(surf, match, hud=None, damaged=(), alpha=1.0, camera_x=0):
+    """Draw everything on top of the stage, alpha of the way from the previous step.
+
+    Returns (sprite rects, HUD rects): sprites have to be painted back next
+    frame, HUD widgets stay put. With a persistent hud, widgets are only
+    repainted when their value changed or a rect in damaged (or a sprite drawn
+    this frame) overlaps them. On a scrolling level the world is drawn shifted
+    left by camera_x, and fighters out of view are skipped.
+    """
+    dirty = []
+
+    # Draw mice
+    dirty += match.mice.draw(surf, alpha, camera_x)
+
+    # Draw players (sprites are wider than rects, hence the margin)
+    left, right = camera_x - FRAME_W * SCALE, camera_x + WIN_W + FRAME_W * SCALE
+    dirty += [f.draw(surf, alpha, camera_x) for f in match.fighters
+              if f.rect.right > left and f.rect.left < right]
+
+    if SHOW_CACHE_STATS:
+        stats = font.render(f"allocs saved/frame: {cache_stats['last_frame']}, "
+                            f"pixels pushed: {renderer_stats['pixels']}", True, BLACK)
+        dirty.append(surf.blit(stats, (20, WIN_H - 40)))
+
+    # HUD goes on top of the sprites
+    if hud is None:
+        hud = RosterHud(len(match.fighters), match.humans) if match.mode == "ffa" else Hud()
+    return dirty, hud.draw(surf, match, list(damaged) + dirty)
+
+# -------------------------------------------------
+# DIRTY-RECT RENDERER
+# -------------------------------------------------
+renderer_stats = {"pixels": 0, "flips": 0, "updates": 0}
+
+class DirtyRenderer:
+    """Only repaints and pushes the parts of the screen that changed.
+
+    Each frame: begin(background) paints last frame's rects back from the
+    cached background, the caller draws the moving things and hands the rects
+    they touched to present(), which pushes old + new rects with
+    display.update(). A new background, or more than full_fraction of the
+    screen changing, falls back to a full flip.
+    """
+    def __init__(self, screen, full_fraction=DIRTY_FULL_FRACTION):
+        self.screen = screen
+        self.full_fraction = full_fraction
+        self.background = None
+        self.prev = []
+        self.full = True
+
+    def invalidate(self):
+        """Force a full redraw next frame (e.g. after the window was exposed)."""
+        self.background = None
+
+    def begin(self, background):
+        """Paint back last frame's rects; returns the rects that got painted over."""
+        if background is not self.background:
+            self.background = background
+            self.prev = [self.screen.blit(background, (0, 0))]
+            self.full = True
+        else:
+            for r in self.prev:
+                self.screen.blit(background, r, r)
+        return self.prev
+
+    def present(self, rects=(), keep=()):
+        """Push the frame; rects get painted back next frame, keep (HUD) stay."""
+        # prev still holds the rects painted back in begin()
+        dirty = self.prev + [r for r in rects if r] + list(keep)
+        pixels = sum(r.width * r.height for r in dirty)
+        if self.full or pixels > self.full_fraction * self.screen.get_width() * self.screen.get_height():
+            pygame.display.flip()
+            renderer_stats["pixels"] = self.screen.get_width() * self.screen.get_height()
+            renderer_stats["flips"] += 1
+        else:
+            if dirty:
+                pygame.display.update(dirty)
+            renderer_stats["pixels"] = pixels
+            renderer_stats["updates"] += 1
+        self.prev = [r for r in rects if r]
+        self.full = False
+
+# -------------------------------------------------
+# FRAME PROFILER
+# -------------------------------------------------
+PROFILE_PHASES = ("events", "update", "physics", "mice", "draw", "present", "tick")
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+class FrameProfiler:
+    """Splits every main-loop frame into phases by lapping one stopwatch.
+
+    lap(phase) charges the time since the previous lap to phase, so the phases
+    of a frame add up to the whole frame. "tick" is the time spent waiting in
+    clock.tick, which is also where a late OS wake-up shows up. Nothing is
+    timed unless the overlay is on (F3) or a trace is being recorded, and
+    record_to() keeps every frame for save() to write out as CSV, or as a
+    Chrome trace (chrome://tracing, Perfetto) when the path ends in .json.
+    Laps from other threads (a planner's private Match) are ignored.
+    """
+    def __init__(self, window=PROFILE_WINDOW):
+        self.owner = threading.main_thread().ident
+        self.overlay = False
+        self.trace_path = None
+        self.enabled = False
+        self.frames = deque(maxlen=window)  # (frame seconds, {phase: seconds})
+        self.trace = []                     # (frame start, frame seconds, [(phase, start, seconds)])
+        self.frame_start = self.last = None
+        self.phases, self.laps = {}, []
+        self.panel = None
+        self.panel_age = 0  # frames since the panel was last rendered
+        self.small_font = None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.trace_path is not None
+        if not self.enabled:
+            self.frame_start = self.last = None
+
+    def record_to(self, path):
+        self.trace_path = path
+        self.enabled = True
+
+    def start_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            total = now - self.frame_start
+            self.frames.append((total, self.phases))
+            if self.trace_path:
+                self.trace.append((self.frame_start, total, self.laps))
+        self.frame_start = self.last = now
+        self.phases, self.laps = {}, []
+
+    def lap(self, phase):
+        if not self.enabled or self.last is None or threading.get_ident() != self.owner:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        if self.trace_path:
+            self.laps.append((phase, self.last, now - self.last))
+        self.last = now
+
+    def draw(self, surf):
+        """Overlay with rolling percentiles, phase means and a spike graph; returns its rect."""
+        if not self.overlay or not self.frames:
+            return None
+        # The text only changes a few times a second; the panel is blitted every frame
+        self.panel_age += 1
+        if self.panel is None or self.panel_age >= 15:
+            self.panel = self.render_panel()
+            self.panel_age = 0
+        return surf.blit(self.panel, (WIN_W - self.panel.get_width() - 10, WIN_H - self.panel.get_height() - 10))
+
+    def render_panel(self):
+        if self.small_font is None:
+            self.small_font = pygame.font.SysFont("consolas", 14)
+        totals = sorted(total for total, _ in self.frames)
+        means = {phase: sum(p.get(phase, 0.0) for _, p in self.frames) / len(self.frames)
+                 for phase in PROFILE_PHASES}
+        lines = [f"frame ms  p50 {percentile(totals, 50) * 1000:5.2f}  "
+                 f"p95 {percentile(totals, 95) * 1000:5.2f}  p99 {percentile(totals, 99) * 1000:5.2f}"]
+        cells = [f"{phase} {means[phase] * 1000:.2f}" for phase in PROFILE_PHASES]
+        lines += ["  ".join(cells[:4]), "  ".join(cells[4:])]
+
+        texts = [self.small_font.render(line, True, WHITE) for line in lines]
+        width = max([self.frames.maxlen] + [t.get_width() for t in texts]) + 20
+        graph_h = 60
+        panel = pygame.Surface((width, 16 * len(lines) + graph_h + 16), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        for i, text in enumerate(texts):
+            panel.blit(text, (10, 5 + 16 * i))
+
+        # One bar per frame, full height = 2 simulation steps; the line is one step
+        top = 16 * len(lines) + 8
+        scale = graph_h / (2 * SIM_DT)
+        for x, (total, _) in enumerate(self.frames):
+            h = min(graph_h, round(total * scale))
+            color = GREEN if total <= SIM_DT else RED
+            pygame.draw.line(panel, color, (10 + x, top + graph_h), (10 + x, top + graph_h - h))
+        pygame.draw.line(panel, WHITE, (10, top + graph_h // 2), (width - 10, top + graph_h // 2))
+        return panel
+
+    def save(self):
+        if not self.trace_path:
+            return
+        if self.trace_path.endswith(".json"):
+            events = []
+            for start, total, laps in self.trace:
+                events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                               "ts": (start - START_TIME) * 1e6, "dur": total * 1e6})
+                events += [{"name": phase, "ph": "X", "pid": 1, "tid": 1,
+                            "ts": (begin - START_TIME) * 1e6, "dur": seconds * 1e6}
+                           for phase, begin, seconds in laps]
+            with open(self.trace_path, "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        else:
+            with open(self.trace_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame", "start_ms", "frame_ms"] + [f"{p}_ms" for p in PROFILE_PHASES])
+                for n, (start, total, laps) in enumerate(self.trace):
+                    phases = dict.fromkeys(PROFILE_PHASES, 0.0)
+                    for phase, _, seconds in laps:
+                        phases[phase] += seconds
+                    writer.writerow([n, f"{(start - START_TIME) * 1000:.3f}", f"{total * 1000:.3f}"]
+                                    + [f"{phases[p] * 1000:.3f}" for p in PROFILE_PHASES])
+        print(f"wrote {len(self.trace)} frame timings to {self.trace_path}")
+
+profiler = FrameProfiler()
+
+# -------------------------------------------------
+# TELEMETRY
+# -------------------------------------------------
+# One row per gameplay event; fighter and other are indexes into
+# match.fighters (-1 for none):
+#   start   amount = TELEMETRY_MODES index, extra = number of fighters
+#   attack  other = first fighter hit (-1 = miss), amount = damage, extra = reach
+#   damage  other = attacker, amount = health lost, extra = health left
+#   heal    amount = health the mouse will give back, extra = health when it was caught
+#   jump
+#   result  fighter = winner (-1 = draw), amount = winner's health, extra = number of fighters
+# The log is a run of blocks, each TELEMETRY_HEADER (magic, version, rows)
+# followed by every column in TELEMETRY_COLUMNS order (little endian), so a
+# log can be appended to forever and read straight into arrays.
+TELEMETRY_EVENTS = ("start", "attack", "damage", "heal", "jump", "result")
+EV_START, EV_ATTACK, EV_DAMAGE, EV_HEAL, EV_JUMP, EV_RESULT = range(len(TELEMETRY_EVENTS))
+TELEMETRY_MODES = ("1player", "2player", "ai", "swarm", "hard", "ffa")
+TELEMETRY_COLUMNS = (("frame", "I"), ("kind", "B"), ("fighter", "h"),
+                     ("other", "h"), ("amount", "h"), ("extra", "h"))
+TELEMETRY_HEADER = struct.Struct("<4sHI")
+TELEMETRY_MAGIC, TELEMETRY_VERSION = b"CATE", 2
+
+class Telemetry:
+    """Logs the gameplay events of the watched match, frame by frame.
+
+    Rows go into in-memory columns; every TELEMETRY_BLOCK rows (and whenever
+    a new match is watched) the columns are handed to a writer thread that
+    appends them to the log, so the frame loop never waits on the disk. Only
+    fighters of the watched match are logged, which leaves out the private
+    Matches a LookaheadAI steps. Does nothing until open().
+    """
+    def __init__(self, block=TELEMETRY_BLOCK):
+        self.block = block
+        self.path = None
+        self.match = None
+        self.index = {}  # fighter -> position in match.fighters
+        self.columns = self.new_columns()
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.stats = {"events": 0, "blocks": 0}
+
+    @staticmethod
+    def new_columns():
+        return [array(code) for _, code in TELEMETRY_COLUMNS]
+
+    def open(self, path):
+        self.path = path
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def watch(self, match):
+        """Log match from now on (None stops logging until the next one)."""
+        self.flush()
+        self.match = match
+        self.index = {f: i for i, f in enumerate(match.fighters)} if match else {}
+        if match is not None and self.path:
+            self.append(EV_START, -1, -1, TELEMETRY_MODES.index(match.mode), len(self.index))
+
+    def record(self, kind, fighter, other=None, amount=0, extra=0):
+        if self.path is None:
+            return
+        i = self.index.get(fighter)
+        if i is not None:
+            self.append(kind, i, self.index.get(other, -1), amount, extra)
+
+    def result(self, fighters, winner):
+        if self.path is None or fighters[0] not in self.index:
+            return
+        self.append(EV_RESULT, self.index.get(winner, -1), -1,
+                    winner.health if winner else 0, len(fighters))
+
+    def append(self, *row):
+        for column, value in zip(self.columns, (self.match.frame,) + row):
+            column.append(value)
+        if len(self.columns[0]) >= self.block:
+            self.flush()
+
+    def flush(self):
+        if self.columns[0]:
+            self.stats["events"] += len(self.columns[0])
+            self.stats["blocks"] += 1
+            self.queue.put(self.columns)
+            self.columns = self.new_columns()
+
+    def close(self):
+        """Write out what is buffered and wait for the writer to finish."""
+        if self.thread is None:
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = self.path = None
+
+    def run(self):
+        with open(self.path, "ab") as f:
+            while (columns := self.queue.get()) is not None:
+                f.write(TELEMETRY_HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, len(columns[0])))
+                for column in columns:
+                    if sys.byteorder != "little":
+                        column.byteswap()
+                    f.write(column.tobytes())
+                f.flush()
+
+telemetry = Telemetry()
+
+# -------------------------------------------------
+# INPUT
+# -------------------------------------------------
+def event_time(e):
+    """perf_counter time of an event: from SDL's timestamp where pygame passes it on, else now."""
+    now = time.perf_counter()
+    stamp = getattr(e, "timestamp", None)
+    if stamp is None:
+        return now
+    return now - max(0, pygame.time.get_ticks() - stamp) / 1000
+
+class InputBuffer:
+    """Key state built from KEYDOWN/KEYUP events rather than polling get_pressed().
+
+    held is what's down right now; taps are the keys pressed since the last
+    step_keys(), so a press and release between two simulation steps still
+    counts as held for one step. With measure on, every press is timed until
+    the step that sees it (input to simulation) and until the frame showing
+    that step is pushed to the screen, presented() (input to present).
+    """
+    def __init__(self, measure=False, window=INPUT_LATENCY_WINDOW):
+        self.held = set()
+        self.taps = set()
+        self.measure = measure
+        self.pending = []   # press times no step has seen yet
+        self.stepped = []   # press times stepped but not presented yet
+        self.to_sim = deque(maxlen=window)
+        self.to_present = deque(maxlen=window)
+
+    def handle(self, e):
+        if e.type == pygame.KEYDOWN:
+            self.held.add(e.key)
+            self.taps.add(e.key)
+            if self.measure:
+                self.pending.append(event_time(e))
+        elif e.type == pygame.KEYUP:
+            self.held.discard(e.key)
+        elif e.type == pygame.WINDOWFOCUSLOST:
+            self.held.clear()  # the KEYUPs go to some other window
+
+    def reset(self):
+        """Forget presses nothing should act on (menu keys, a match being left)."""
+        self.taps.clear()
+        self.pending.clear()
+        self.stepped.clear()
+
+    def step_keys(self):
+        keys = KeyState(self.held | self.taps)
+        self.taps.clear()
+        if self.pending:
+            now = time.perf_counter()
+            self.to_sim.extend(now - t for t in self.pending)
+            self.stepped += self.pending
+            self.pending.clear()
+        return keys
+
+    def presented(self):
+        if self.stepped:
+            now = time.perf_counter()
+            self.to_present.extend(now - t for t in self.stepped)
+            self.stepped.clear()
+
+    def report(self):
+        if not self.to_present:
+            return "input latency: no presses measured yet"
+        to_sim, to_present = sorted(self.to_sim), sorted(self.to_present)
+        return (f"input latency over {len(to_present)} presses: "
+                f"to simulation p50 {percentile(to_sim, 50) * 1000:.1f} ms, "
+                f"p95 {percentile(to_sim, 95) * 1000:.1f} ms; "
+                f"to present p50 {percentile(to_present, 50) * 1000:.1f} ms, "
+                f"p95 {percentile(to_present, 95) * 1000:.1f} ms")
+
+# -------------------------------------------------
+# HEADLESS SIMULATION
+# -------------------------------------------------
+def init_headless():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.init()
+
+def run_headless(matches=100, max_frames=60 * 60 * 5, mode="ai", seed=None):
+    """Play matches with no window, no sound and no frame cap; return the results.
+
+    With a seed, match k is seeded with seed + k so the whole run is repeatable.
+    """
+    init_headless()
+
+    results = []
+    for k in range(matches):
+        match_seed = None if seed is None else seed + k
+        match = FreeForAll(seed=match_seed, humans=0) if mode == "ffa" else Match(mode, match_seed)
+        telemetry.watch(match)
+        while match.result is None and match.frame < max_frames:
+            match.step()
+        results.append((match.result, match.frame))
+    telemetry.watch(None)
+    return results
+
+# -------------------------------------------------
+# MAIN LOOP
+# -------------------------------------------------
+def display_refresh_rate():
+    """Desktop refresh rate where pygame can report it (pygame-ce), else RENDER_FPS."""
+    try:
+        rate = pygame.display.get_desktop_refresh_rates()[0]
+    except (AttributeError, IndexError, pygame.error):
+        rate = 0
+    return rate if rate > 0 else RENDER_FPS
+
+def main(record_dir=None, render_fps=None, profile_path=None, measure_input=False, level_path=None,
+         telemetry_path=None):
+    open_window()
+    if profile_path:
+        profiler.record_to(profile_path)
+    if telemetry_path:
+        telemetry.open(telemetry_path)
+    assets = AssetManager()
+    first_frame, interactive = show_loading_screen(assets)
+    print(f"time to first frame: {first_frame * 1000:.0f} ms, "
+          f"time to interactive: {interactive * 1000:.0f} ms")
+    render_fps = render_fps or display_refresh_rate()
+    renderer = DirtyRenderer(WIN)
+    stage, menu_screen = draw_stage(), draw_menu_screen()
+    hud = Hud()
+    # A level file scrolls: its stage is composited under a camera each frame
+    level = view = camera = None
+    if level_path:
+        import arena
+        level = arena.ChunkedLevel(level_path)
+        view, camera = arena.ArenaView(level), arena.Camera(level.width)
+    game_state = GAME_STATE
+    match = Match(level=level)
+    recorder = planner = None
+    inputs = InputBuffer(measure_input)
+    last_report = time.perf_counter()
+
+    def start(mode):
+        # Save the match being left (if any) and record the new one
+        nonlocal match, recorder, planner, hud
+        if recorder:
+            recorder.save_to_dir(record_dir)
+        if planner:
+            planner.stop()
+        match.mice.clear()  # also stops the squeak loop of the mice left running
+        if mode == "ffa":
+            match, hud = FreeForAll(level=level), RosterHud(FFA_FIGHTERS)
+        else:
+            match, hud = Match(mode, level=level), Hud()
+        planner = LookaheadAI(match) if mode == "hard" else None
+        telemetry.watch(None if mode == "menu" else match)
+        inputs.reset()
+        if camera:
+            camera.snap(match)
+        # A free-for-all has no fixed-size snapshot to record from, and a
+        # recording doesn't say which level file it was played on
+        if record_dir and mode not in ("menu", "ffa") and not level:
+            import replay
+            recorder = replay.Recorder(match)
+        else:
+            recorder = None
+
+    # Fixed-timestep loop: the simulation eats real time in SIM_DT steps, and
+    # every rendered frame shows the fighters and mice interpolated between
+    # the last two steps, so gameplay speed never depends on the frame rate.
+    accumulator = 0.0
+    last_time = time.perf_counter()
+
+    while True:
+        profiler.start_frame()
+        now = time.perf_counter()
+        accumulator += now - last_time
+        last_time = now
+        if not assets.done and assets.poll():
+            print(f"all assets loaded: {(now - START_TIME) * 1000:.0f} ms")
+
+        # Input is read right before the simulation steps; only the asset
+        # poll above sits between the frame wait and here
+        for e in pygame.event.get():
+            inputs.handle(e)
+            if e.type == pygame.QUIT or (e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
+                start("menu")
+                profiler.save()
+                telemetry.close()
+                if measure_input:
+                    print(inputs.report())
+                pygame.quit(); sys.exit()
+            if e.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+            if e.type == pygame.KEYDOWN:
+                if e.key == pygame.K_F1:
+                    game_state = "menu"
+                    start(game_state)
+                elif e.key == pygame.K_F3:
+                    profiler.toggle_overlay()
+                elif game_state == "menu":
+                    if e.key == pygame.K_1:
+                        game_state = "1player"
+                        start(game_state)
+                    elif e.key == pygame.K_2:
+                        game_state = "2player"
+                        start(game_state)
+                    elif e.key == pygame.K_3:
+                        game_state = "swarm"
+                        start(game_state)
+                    elif e.key == pygame.K_4:
+                        game_state = "hard"
+                        start(game_state)
+                    elif e.key == pygame.K_5:
+                        game_state = "ffa"
+                        start(game_state)
+
+        if game_state == "menu":
+            # Static screen: nothing to push after the first frame
+            accumulator = 0.0
+            inputs.reset()
+            profiler.lap("events")
+            renderer.begin(menu_screen)
+            overlay = profiler.draw(WIN)
+            profiler.lap("draw")
+            renderer.present([overlay])
+            profiler.lap("present")
+        else:
+            profiler.lap("events")
+            steps = 0
+            while accumulator >= SIM_DT and steps < MAX_CATCHUP_STEPS:
+                # Taps since the last step only go to the first of a catch-up run
+                keys = inputs.step_keys()
+                step_keys = planner.plan_keys(keys, match) if planner else keys
+                if recorder:
+                    recorder.record(step_keys)
+                match.step(step_keys)
+                if camera:
+                    camera.follow(match)
+                if planner:
+                    planner.observe(match, keys)
+                accumulator -= SIM_DT
+                steps += 1
+            if steps == MAX_CATCHUP_STEPS:
+                # Too far behind to catch up: drop the backlog (the game slows
+                # down instead of spiralling)
+                accumulator = min(accumulator, SIM_DT)
+            camera_x = camera.view(accumulator / SIM_DT) if camera else 0
+            damaged = renderer.begin(view.background(camera_x) if view else stage)
+            sprites, widgets = draw_match(WIN, match, hud, damaged, accumulator / SIM_DT, camera_x)
+            sprites.append(profiler.draw(WIN))
+            profiler.lap("draw")
+            renderer.present(sprites, widgets)
+            inputs.presented()
+            profiler.lap("present")
+            if measure_input and now - last_report >= INPUT_REPORT_EVERY:
+                print(inputs.report())
+                last_report = now
+
+        end_frame_stats()
+        sounds.end_frame()
+        clock.tick(FPS if game_state == "menu" else render_fps)
+        profiler.lap("tick")
+
+if __name__ == "__main__":
+    # arena.py and replay.py `import game`; without this they would get a
+    # second copy of this file, one whose assets were never loaded
+    sys.modules.setdefault("game", sys.modules[__name__])
+    if "--headless" in sys.argv:
+        count = int(sys.argv[sys.argv.index("--matches") + 1]) if "--matches" in sys.argv else 100
+        seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else None
+        mode = sys.argv[sys.argv.index("--mode") + 1] if "--mode" in sys.argv else "ai"
+        if "--telemetry" in sys.argv:
+            telemetry.open(sys.argv[sys.argv.index("--telemetry") + 1])
+        start = time.perf_counter()
+        results = run_headless(count, mode=mode, seed=seed)
+        telemetry.close()
+        elapsed = time.perf_counter() - start
+        frames = sum(f for _, f in results)
+        for outcome in ("player1", "player2", "draw", None):
+            print(f"{outcome or 'unfinished'}: {sum(1 for r, _ in results if r == outcome)}")
+        print(f"{count} matches, {frames} frames in {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)")
+    else:
+        record_dir = None
+        if "--record" in sys.argv:
+            i = sys.argv.index("--record")
+            record_dir = sys.argv[i + 1] if i + 1 < len(sys.argv) and not sys.argv[i + 1].startswith("--") else "replays"
+        render_fps = int(sys.argv[sys.argv.index("--render-fps") + 1]) if "--render-fps" in sys.argv else None
+        profile_path = sys.argv[sys.argv.index("--profile") + 1] if "--profile" in sys.argv else None
+        level_path = sys.argv[sys.argv.index("--level") + 1] if "--level" in sys.argv else None
+        telemetry_path = sys.argv[sys.argv.index("--telemetry") + 1] if "--telemetry" in sys.argv else None
+        main(record_dir, render_fps, profile_path, "--input-latency" in sys.argv, level_path, telemetry_path)
@@ -0,0 +1,332 @@
+"""Online versus over UDP with rollback.
+
+Both peers step the same 2-player Match (the host picks the seed in the
+handshake; the host is player 1, whoever joins is player 2). Each frame the
+local input is sampled and scheduled INPUT_DELAY frames ahead, then sent to
+the peer. A frame whose remote input hasn't arrived yet is simulated with a
+prediction (the last remote input we know). When a late input disagrees with
+what was predicted, the Match is restored to the snapshot taken before that
+frame and re-stepped up to the present, silently. A peer never runs more
+than ROLLBACK_WINDOW frames past the last remote input it has; it waits
+instead.
+
+Every input packet repeats all inputs the peer hasn't acknowledged yet, so a
+lost packet costs nothing but a possible rollback. Both players use the
+player 1 keys (WASD, R, T) on their own keyboard.
+
+    python netplay.py host [--port 7000]
+    python netplay.py join 192.168.1.20[:7000]
+    python netplay.py loopback [--frames 600]   # two headless peers, checked for desync
+
+Options for all three: --delay FRAMES, --rollback FRAMES, and to fake a bad
+network on the sending side --latency MS, --jitter MS, --loss FRACTION.
+"""
+import heapq, random, socket, struct, sys, time
+import game
+
+INPUT_DELAY = 2        # frames between sampling a local input and applying it
+ROLLBACK_WINDOW = 8    # most frames simulated ahead of the last confirmed remote input
+NET_PORT = 7000
+
+HELLO = b"H"
+WELCOME = struct.Struct("<cQ")    # b"W", seed
+INPUTS = struct.Struct("<ciiB")   # b"I", first frame, ack, count; then count input bytes
+HELLO_EVERY = 0.1                 # seconds between HELLOs while joining
+
+
+class Link:
+    """Non-blocking UDP socket to one peer, optionally faking latency, jitter and loss.
+
+    The fake network only acts on outgoing packets; delayed ones sit in an
+    outbox until receive() (or flush()) finds them due.
+    """
+    def __init__(self, sock, peer=None, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        sock.setblocking(False)
+        self.sock = sock
+        self.peer = peer
+        self.latency, self.jitter, self.loss = latency, jitter, loss
+        self.rng = random.Random(seed)
+        self.outbox = []  # heap of (due, n, data, address)
+        self.sent = self.dropped = 0
+
+    def send(self, data, address=None):
+        address = address or self.peer
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        self.sent += 1
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            heapq.heappush(self.outbox, (time.perf_counter() + delay, self.sent, data, address))
+        else:
+            self.sock.sendto(data, address)
+
+    def flush(self):
+        now = time.perf_counter()
+        while self.outbox and self.outbox[0][0] <= now:
+            _, _, data, address = heapq.heappop(self.outbox)
+            self.sock.sendto(data, address)
+
+    def receive(self):
+        """Every (data, address) waiting on the socket."""
+        self.flush()
+        packets = []
+        while True:
+            try:
+                packets.append(self.sock.recvfrom(2048))
+            except BlockingIOError:
+                return packets
+            except ConnectionResetError:
+                continue  # Windows reports an ICMP port unreachable this way
+
+
+class RollbackSession:
+    """One peer's side of a networked Match; call advance() once per frame.
+
+    player is 0 for player 1 (the host) and 1 for player 2. Inputs are 5-bit
+    masks in game.CONTROL_NAMES order, one per player per frame.
+    """
+    def __init__(self, link, player, seed, delay=INPUT_DELAY, window=ROLLBACK_WINDOW):
+        self.link = link
+        self.player = player
+        self.delay, self.window = delay, window
+        self.match = game.Match("2player", seed)
+        # Nobody can have pressed anything during the first delay frames
+        self.local = dict.fromkeys(range(delay), 0)
+        self.remote = dict.fromkeys(range(delay), 0)
+        self.remote_confirmed = delay - 1  # every remote input up to here has arrived
+        self.remote_ack = delay - 1        # the peer has all of our inputs up to here
+        self.predicted = {}                # remote input each unconfirmed frame was stepped with
+        self.states = {}                   # snapshot from before each unconfirmed frame
+        self.rollback_from = None
+        self.stats = {"rollbacks": 0, "resimulated": 0, "max_depth": 0, "stalls": 0}
+
+    def keys_for(self, frame):
+        """(remote input used, KeyState) for frame, predicting a missing remote input."""
+        remote = self.remote.get(frame)
+        if remote is None:
+            remote = self.remote.get(self.remote_confirmed, 0)
+        local = self.local[frame]
+        p1, p2 = (local, remote) if self.player == 0 else (remote, local)
+        return remote, game.bits_to_keys(p1 | p2 << 5, (self.match.p1, self.match.p2))
+
+    def _step(self):
+        frame = self.match.frame
+        self.states[frame] = self.match.snapshot()
+        self.predicted[frame], keys = self.keys_for(frame)
+        self.match.step(keys)
+
+    def advance(self, local_bits):
+        """Take in the network, then step one frame unless too far ahead; True if it stepped."""
+        self.poll()
+        stepped = self.match.frame - self.remote_confirmed <= self.window
+        if stepped:
+            self.local[self.match.frame + self.delay] = local_bits
+            self._step()
+        else:
+            self.stats["stalls"] += 1
+        self.send_inputs()
+        return stepped
+
+    def poll(self):
+        """Read every waiting packet and roll back if a remote input was mispredicted."""
+        for data, address in self.link.receive():
+            kind = data[:1]
+            if kind == b"I" and len(data) >= INPUTS.size:
+                self._receive_inputs(data)
+            elif kind == HELLO and self.player == 0:
+                # Our WELCOME got lost; the match started anyway
+                self.link.send(WELCOME.pack(b"W", self.match.seed), address)
+
+        if self.rollback_from is not None:
+            self._rollback(self.rollback_from)
+            self.rollback_from = None
+
+        # Frames every input is known for never get rolled back again. The
+        # peer may be ahead of us, so nothing not yet simulated is dropped.
+        for frame in [f for f in self.states if f <= self.remote_confirmed]:
+            del self.states[frame]
+            self.predicted.pop(frame, None)
+        done = self.match.frame - 1
+        for frame in [f for f in self.remote if f < min(self.remote_confirmed, done)]:
+            del self.remote[frame]  # remote_confirmed itself stays, it's the prediction
+        for frame in [f for f in self.local if f <= min(self.remote_ack, self.remote_confirmed, done)]:
+            del self.local[frame]
+
+    def _receive_inputs(self, data):
+        _, first, ack, count = INPUTS.unpack_from(data)
+        self.remote_ack = max(self.remote_ack, ack)
+        for frame, bits in enumerate(data[INPUTS.size:INPUTS.size + count], first):
+            if frame in self.remote or frame <= self.remote_confirmed:
+                continue
+            self.remote[frame] = bits
+            if frame < self.match.frame and self.predicted.get(frame) != bits:
+                if self.rollback_from is None or frame < self.rollback_from:
+                    self.rollback_from = frame
+        while self.remote_confirmed + 1 in self.remote:
+            self.remote_confirmed += 1
+
+    def _rollback(self, frame):
+        depth = self.match.frame - frame
+        self.stats["rollbacks"] += 1
+        self.stats["resimulated"] += depth
+        self.stats["max_depth"] = max(self.stats["max_depth"], depth)
+        self.match.restore(self.states[frame])
+        game.sounds.muted = True  # those sounds already played the first time round
+        try:
+            for _ in range(depth):
+                self._step()
+        finally:
+            game.sounds.muted = False
+
+    def send_inputs(self):
+        """Send every local input the peer hasn't acknowledged (at most 255)."""
+        first = self.remote_ack + 1
+        inputs = bytes(self.local[f] for f in range(first, first + 255) if f in self.local)
+        self.link.send(INPUTS.pack(b"I", first, self.remote_confirmed, len(inputs)) + inputs)
+
+    @property
+    def synced(self):
+        """True once every input up to the current frame is confirmed by both sides."""
+        last = self.match.frame - 1
+        return self.remote_confirmed >= last and self.remote_ack >= last
+
+
+# -------------------------------------------------
+# CONNECTING
+# -------------------------------------------------
+def udp_socket(port=0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("", port))
+    return sock
+
+
+def host(port=NET_PORT, delay=INPUT_DELAY, window=ROLLBACK_WINDOW, **network):
+    """Wait for someone to join; returns the session once they have."""
+    link = Link(udp_socket(port), **network)
+    print(f"Waiting for a player on UDP port {port}...")
+    while True:
+        for data, address in link.receive():
+            if data == HELLO:
+                link.peer = address
+                seed = random.randrange(2**63)
+                link.send(WELCOME.pack(b"W", seed))
+                print(f"{address[0]}:{address[1]} joined")
+                return RollbackSession(link, 0, seed, delay, window)
+        time.sleep(0.01)
+
+
+def join(address, port=NET_PORT, delay=INPUT_DELAY, window=ROLLBACK_WINDOW, **network):
+    """Say hello to the host until it answers with the match seed."""
+    link = Link(udp_socket(), (socket.gethostbyname(address), port), **network)
+    print(f"Joining {address}:{port}...")
+    while True:
+        link.send(HELLO)
+        deadline = time.perf_counter() + HELLO_EVERY
+        while time.perf_counter() < deadline:
+            for data, _ in link.receive():
+                if data[:1] == b"W" and len(data) == WELCOME.size:
+                    _, seed = WELCOME.unpack(data)
+                    return RollbackSession(link, 1, seed, delay, window)
+            time.sleep(0.005)
+
+
+# -------------------------------------------------
+# PLAYING
+# -------------------------------------------------
+def play(session):
+    """Windowed match at the game's simulation rate; returns when it's closed."""
+    game.load_assets()
+    pygame = game.pygame
+    renderer = game.DirtyRenderer(game.WIN)
+    stage, hud = game.draw_stage(), game.Hud()
+    match = session.match
+    inputs = game.InputBuffer()
+    while True:
+        for e in pygame.event.get():
+            inputs.handle(e)
+            if e.type == pygame.QUIT or (e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
+                return session
+        session.advance(game.keys_to_bits(inputs.step_keys(), (match.p1,)))
+        damaged = renderer.begin(stage)
+        renderer.present(*game.draw_match(game.WIN, match, hud, damaged))
+        game.end_frame_stats()
+        game.sounds.end_frame()
+        game.clock.tick(game.FPS)
+
+
+def scripted_inputs(frames, seed, hold=10):
+    """Random 5-bit masks, each held for hold frames, like a player mashing keys."""
+    rng = random.Random(seed)
+    inputs = []
+    while len(inputs) < frames:
+        inputs += [rng.getrandbits(5)] * hold
+    return inputs[:frames]
+
+
+def loopback(frames=600, delay=INPUT_DELAY, window=ROLLBACK_WINDOW, seed=0, timeout=10.0, **network):
+    """Two peers on 127.0.0.1 with scripted inputs, stepped in real time.
+
+    Both end states are checked against each other and against a plain Match
+    stepped with the same inputs. Returns True if all three agree.
+    """
+    game.init_headless()
+    socks = udp_socket(), udp_socket()
+    addresses = [("127.0.0.1", s.getsockname()[1]) for s in socks]
+    sessions = [RollbackSession(Link(socks[i], addresses[1 - i], seed=i, **network), i, seed, delay, window)
+                for i in range(2)]
+    scripts = [scripted_inputs(frames + delay, seed + 1 + i) for i in range(2)]
+    for script in scripts:
+        script[:delay] = [0] * delay  # what the sessions apply before the first delayed input
+
+    began = next_tick = time.perf_counter()
+    while not all(s.match.frame >= frames and s.synced for s in sessions):
+        if time.perf_counter() - began > frames * game.SIM_DT + timeout:
+            print("timed out waiting for the peers to sync")
+            return False
+        for session, script in zip(sessions, scripts):
+            if session.match.frame < frames:
+                session.advance(script[session.match.frame + delay])
+            else:
+                session.poll()
+                session.send_inputs()
+        next_tick += game.SIM_DT
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    reference = game.Match("2player", seed)
+    for frame in range(frames):
+        p1, p2 = (scripts[0][frame], scripts[1][frame])
+        reference.step(game.bits_to_keys(p1 | p2 << 5, (reference.p1, reference.p2)))
+    states = [m.snapshot() for m in (sessions[0].match, sessions[1].match, reference)]
+
+    for name, session in zip(("host", "guest"), sessions):
+        print(f"{name}: {session.stats}, {session.link.sent} packets sent, {session.link.dropped} dropped")
+    synced = states[0] == states[1] == states[2]
+    print(f"{frames} frames, result {reference.result}: {'in sync' if synced else 'DESYNC'}")
+    return synced
+
+
+def main(argv):
+    def option(name, default, kind=int):
+        return kind(argv[argv.index(name) + 1]) if name in argv else default
+
+    settings = {"delay": option("--delay", INPUT_DELAY), "window": option("--rollback", ROLLBACK_WINDOW),
+                "latency": option("--latency", 0.0, float) / 1000, "jitter": option("--jitter", 0.0, float) / 1000,
+                "loss": option("--loss", 0.0, float)}
+    what = argv[0] if argv else "loopback"
+    if what == "loopback":
+        return 0 if loopback(option("--frames", 600), **settings) else 1
+    if what == "host":
+        session = host(option("--port", NET_PORT), **settings)
+    elif what == "join" and len(argv) > 1:
+        address, _, port = argv[1].partition(":")
+        session = join(address, int(port) if port else NET_PORT, **settings)
+    else:
+        sys.exit(__doc__)
+    play(session)
+    print(session.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
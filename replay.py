@@ -0,0 +1,187 @@
+"""Compact match recordings and fast-forward replay.
+
+A recording is the Match seed plus one 16-bit mask of the ten control keys
+per frame (see game.keys_to_bits), with a state snapshot embedded every
+SNAPSHOT_EVERY frames for seeking. Because all randomness in a Match comes
+from its seed, re-stepping the same masks reproduces the match exactly.
+
+File layout (little endian):
+    header     HEADER (magic, version, mode, result, seed, frames, interval, snapshots)
+    inputs     frames x uint16
+    snapshots  each SNAPSHOT (frame, size) + zlib-compressed Match.snapshot() blob
+
+    python replay.py replays/xyz.catr                 # play back in real time
+    python replay.py replays/xyz.catr --speed 10      # 10x
+    python replay.py replays/xyz.catr --speed max     # re-simulate, verify, no window
+    python replay.py replays/xyz.catr --to 36000      # seek, then play from there
+"""
+import os, struct, sys, time, zlib
+from array import array
+import game
+
+MAGIC = b"CATR"
+VERSION = 4
+HEADER = struct.Struct("<4sHBBQIII")
+SNAPSHOT = struct.Struct("<II")
+SNAPSHOT_EVERY = 1800  # frames (30 seconds at 60 FPS)
+
+MODES = ("1player", "2player", "ai", "swarm", "hard")
+RESULTS = (None, "player1", "player2", "draw")
+
+
+class Recording:
+    def __init__(self, mode, seed, inputs=None, snapshots=None, result=None,
+                 snapshot_every=SNAPSHOT_EVERY):
+        self.mode = mode
+        self.seed = seed
+        self.inputs = inputs if inputs is not None else array("H")
+        self.snapshots = snapshots if snapshots is not None else {}  # frame -> state
+        self.result = result
+        self.snapshot_every = snapshot_every
+
+    def to_bytes(self):
+        inputs = array("H", self.inputs)
+        if sys.byteorder != "little":
+            inputs.byteswap()
+        parts = [HEADER.pack(MAGIC, VERSION, MODES.index(self.mode), RESULTS.index(self.result),
+                             self.seed, len(inputs), self.snapshot_every, len(self.snapshots)),
+                 inputs.tobytes()]
+        for frame, state in sorted(self.snapshots.items()):
+            blob = zlib.compress(state)
+            parts.append(SNAPSHOT.pack(frame, len(blob)))
+            parts.append(blob)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, mode, result, seed, frames, interval, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a Cat Fighter recording (or an unsupported version)")
+        offset = HEADER.size
+        inputs = array("H")
+        inputs.frombytes(data[offset:offset + frames * 2])
+        if sys.byteorder != "little":
+            inputs.byteswap()
+        offset += frames * 2
+
+        snapshots = {}
+        for _ in range(count):
+            frame, size = SNAPSHOT.unpack_from(data, offset)
+            offset += SNAPSHOT.size
+            snapshots[frame] = zlib.decompress(data[offset:offset + size])
+            offset += size
+        return cls(MODES[mode], seed, inputs, snapshots, RESULTS[result], interval)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class Recorder:
+    """Collects a Match's inputs; call record(keys) right before match.step(keys)."""
+    def __init__(self, match, snapshot_every=SNAPSHOT_EVERY):
+        self.match = match
+        self.recording = Recording(match.mode, match.seed, snapshot_every=snapshot_every)
+
+    def record(self, keys):
+        match = self.match
+        if match.frame % self.recording.snapshot_every == 0:
+            self.recording.snapshots[match.frame] = match.snapshot()
+        self.recording.inputs.append(game.keys_to_bits(keys, (match.p1, match.p2)))
+
+    def save_to_dir(self, directory):
+        self.recording.result = self.match.result
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + f"-{self.match.seed:x}.catr")
+        self.recording.save(path)
+        print(f"Saved replay: {path} ({len(self.recording.inputs)} frames)")
+        return path
+
+
+class Player:
+    """Re-simulates a Recording; seek() jumps via the nearest embedded snapshot."""
+    def __init__(self, recording):
+        self.recording = recording
+        self.match = game.Match(recording.mode, recording.seed)
+        self.mismatches = []  # snapshot frames where the re-simulation disagreed
+
+    @property
+    def done(self):
+        return self.match.frame >= len(self.recording.inputs)
+
+    def step(self):
+        match = self.match
+        expected = self.recording.snapshots.get(match.frame)
+        if expected is not None and match.snapshot() != expected:
+            self.mismatches.append(match.frame)
+        bits = self.recording.inputs[match.frame]
+        match.step(game.bits_to_keys(bits, (match.p1, match.p2)))
+
+    def seek(self, frame):
+        frame = max(0, min(frame, len(self.recording.inputs)))
+        usable = [f for f in self.recording.snapshots if f <= frame]
+        start = max(usable) if usable else 0
+        if start > self.match.frame or frame < self.match.frame:
+            if start:
+                self.match.restore(self.recording.snapshots[start])
+            else:
+                self.match = game.Match(self.recording.mode, self.recording.seed)
+        while self.match.frame < frame:
+            self.step()
+
+
+def play(recording, speed=1, start=0):
+    """Watch a recording from frame start; speed is frames simulated per displayed frame."""
+    player = Player(recording)
+    player.seek(start)  # uncapped and unrendered, before any sound is loaded
+
+    game.load_assets()
+    pygame = game.pygame
+    renderer = game.DirtyRenderer(game.WIN)
+    stage, hud = game.draw_stage(), game.Hud()
+    while not player.done:
+        for e in pygame.event.get():
+            if e.type == pygame.QUIT or (e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
+                return player
+        for _ in range(speed):
+            if not player.done:
+                player.step()
+        damaged = renderer.begin(stage)
+        renderer.present(*game.draw_match(game.WIN, player.match, hud, damaged))
+        game.end_frame_stats()
+        game.sounds.end_frame()
+        game.clock.tick(game.FPS)
+    return player
+
+
+def main(argv):
+    recording = Recording.load(argv[0])
+    speed = argv[argv.index("--speed") + 1] if "--speed" in argv else "1"
+    start = int(argv[argv.index("--to") + 1]) if "--to" in argv else 0
+    print(f"{recording.mode} match, seed {recording.seed}, {len(recording.inputs)} frames, "
+          f"{len(recording.snapshots)} snapshots, recorded result: {recording.result}")
+
+    if speed == "max":
+        game.init_headless()
+        began = time.perf_counter()
+        player = Player(recording)
+        player.seek(len(recording.inputs))
+        elapsed = time.perf_counter() - began
+        print(f"re-simulated {player.match.frame} frames in {elapsed:.2f}s, result: {player.match.result}")
+    else:
+        player = play(recording, int(speed), start)
+
+    if player.mismatches:
+        print(f"DESYNC at snapshot frames: {player.mismatches}")
+    elif player.done and player.match.result != recording.result:
+        print("DESYNC: result differs from the recording")
+    return 1 if player.mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
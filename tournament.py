@@ -0,0 +1,125 @@
+"""AI-vs-AI parameter sweeps spread over every core.
+
+Each configuration is an AIParams with some fields overridden; it plays
+--matches headless matches against the default AI, alternating sides. Every
+match has its own seed (--seed + match number, the same set for every
+configuration), so a sweep is fully repeatable. Results stream back as worker
+chunks finish and are summarised in a table at the end.
+
+    python tournament.py --matches 200 difficulty=0.5,0.7,0.9 near_distance=40,60,80
+"""
+import itertools, os, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import game
+
+MAX_FRAMES = 60 * 60 * 5  # 5 minutes of game time, then the match is a timeout
+CHUNK = 10                # matches per worker task
+
+
+def _init_worker():
+    game.init_headless()
+    sys.stdout = open(os.devnull, "w")  # keep the workers' game prints off the table
+
+
+def new_stats():
+    return {"matches": 0, "wins": 0, "losses": 0, "draws": 0, "timeouts": 0,
+            "frames": 0, "dealt": 0, "taken": 0}
+
+
+def play_chunk(config_idx, overrides, seeds, max_frames=MAX_FRAMES):
+    """Play one batch of matches for a configuration and return its stats."""
+    challenger, baseline = game.AIParams(**overrides), game.AIParams()
+    stats = new_stats()
+    for seed in seeds:
+        challenger_is_p1 = seed % 2 == 0
+        ai = (challenger, baseline) if challenger_is_p1 else (baseline, challenger)
+        match = game.Match("ai", seed, ai)
+        while match.result is None and match.frame < max_frames:
+            match.step()
+
+        me, them = (match.p1, match.p2) if challenger_is_p1 else (match.p2, match.p1)
+        stats["matches"] += 1
+        stats["frames"] += match.frame
+        stats["dealt"] += me.damage_dealt
+        stats["taken"] += them.damage_dealt
+        if match.result is None:
+            stats["timeouts"] += 1
+        elif match.result == "draw":
+            stats["draws"] += 1
+        elif (match.result == "player1") == challenger_is_p1:
+            stats["wins"] += 1
+        else:
+            stats["losses"] += 1
+    return config_idx, stats
+
+
+def parse_sweep(args):
+    """Turn ["difficulty=0.5,0.7", "poke=0.2"] into a list of override dicts."""
+    names, values = [], []
+    for arg in args:
+        name, _, raw = arg.partition("=")
+        if not hasattr(game.AIParams(), name):
+            raise SystemExit(f"unknown AI parameter: {name}")
+        names.append(name)
+        values.append([float(v) for v in raw.split(",")])
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def run(configs, matches=100, seed=0, workers=None, max_frames=MAX_FRAMES, out=print):
+    totals = [new_stats() for _ in configs]
+    seeds = list(range(seed, seed + matches))
+    chunks = [seeds[i:i + CHUNK] for i in range(0, len(seeds), CHUNK)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(play_chunk, idx, config, chunk, max_frames)
+                   for idx, config in enumerate(configs) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            idx, stats = future.result()
+            total = totals[idx]
+            for key, value in stats.items():
+                total[key] += value
+            out(f"[{done}/{len(futures)}] {format_config(configs[idx])}: "
+                f"{total['wins']}/{total['matches']} wins so far")
+    return totals
+
+
+def format_config(config):
+    return " ".join(f"{k}={v:g}" for k, v in config.items()) or "defaults"
+
+
+def format_table(configs, totals):
+    rows = [("config", "matches", "win %", "draw %", "timeout %", "avg frames", "dealt/match", "taken/match")]
+    order = sorted(range(len(configs)), key=lambda i: -totals[i]["wins"] / max(1, totals[i]["matches"]))
+    for i in order:
+        t, n = totals[i], max(1, totals[i]["matches"])
+        rows.append((format_config(configs[i]), str(t["matches"]),
+                     f"{100 * t['wins'] / n:.1f}", f"{100 * t['draws'] / n:.1f}",
+                     f"{100 * t['timeouts'] / n:.1f}", f"{t['frames'] / n:.0f}",
+                     f"{t['dealt'] / n:.1f}", f"{t['taken'] / n:.1f}"))
+    widths = [max(len(row[c]) for row in rows) for c in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(w) for cell, w in zip(row, widths)) for row in rows)
+
+
+def main(argv):
+    def option(name, default, cast=int):
+        if name in argv:
+            i = argv.index(name)
+            value = cast(argv[i + 1])
+            del argv[i:i + 2]
+            return value
+        return default
+
+    matches = option("--matches", 100)
+    seed = option("--seed", 0)
+    workers = option("--workers", None)
+    max_frames = option("--max-frames", MAX_FRAMES)
+    configs = parse_sweep(argv) or [{}]
+
+    start = time.perf_counter()
+    totals = run(configs, matches, seed, workers, max_frames)
+    print()
+    print(format_table(configs, totals))
+    print(f"\n{len(configs) * matches} matches in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])